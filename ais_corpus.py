@@ -0,0 +1,81 @@
+import random
+
+from pyais.encode import encode_dict
+
+
+# Corpus AIS sintetico per benchmark e replay, generato con l'encoder di pyais.
+# Mix indicativo di un porto trafficato: soprattutto posizioni classe A/B,
+# qualche messaggio statico (tipo 5 multi-part, tipo 24 parte A/B).
+MESSAGE_MIX = (1, 1, 1, 1, 2, 3, 3, 18, 18, 18, 5, 24)
+# Mix con anche stazioni base, SAR, AtoN, binari e safety (benchmark dell'estrazione dei campi)
+EXTENDED_MIX = MESSAGE_MIX + (4, 6, 8, 9, 12, 14, 19, 21, 27)
+# Area di default (Tirreno settentrionale)
+AREA = (8.0, 40.0, 14.0, 45.0)
+
+
+# Campi fissi dei tipi meno frequenti (posizione e MMSI aggiunti per ogni messaggio)
+_OTHER_TYPES = {
+    4: {"year": 2026, "month": 10, "day": 18, "hour": 12, "minute": 0, "second": 0, "epfd": 1},
+    6: {"dest_mmsi": 247000001, "dac": 1, "fid": 0, "data": b"\x01\x02\x03"},
+    8: {"dac": 1, "fid": 31, "wspeed": 12, "airtemp": 18.5},
+    9: {"alt": 300, "speed": 120, "course": 90},
+    12: {"dest_mmsi": 247000001, "text": "SAFETY TEST"},
+    14: {"text": "SECURITE"},
+    19: {"speed": 5.0, "course": 90, "heading": 90, "shipname": "DIPORTO", "ship_type": 37,
+         "to_bow": 10, "to_stern": 2, "to_port": 2, "to_starboard": 2},
+    21: {"aid_type": 1, "name": "FARO", "to_bow": 1, "to_stern": 1, "to_port": 1, "to_starboard": 1},
+    27: {"speed": 10, "course": 90, "status": 0},
+}
+
+
+def _encode(data, **kwargs):
+    # VDM: messaggi ricevuti da altre navi, come quelli che arrivano dai Moxa
+    return encode_dict(data, sentence_type="VDM", **kwargs)
+
+
+def synthetic_messages(count, fleet_size=2000, seed=42, area=AREA, mix=MESSAGE_MIX):
+    """Restituisce ``count`` messaggi assemblati: stringa per i singoli, lista di frammenti per i multi-part."""
+    rng = random.Random(seed)
+    lon_min, lat_min, lon_max, lat_max = area
+    fleet = [247000000 + i for i in range(fleet_size)]
+    messages = []
+    seq_id = 0
+    for _ in range(count):
+        mmsi = rng.choice(fleet)
+        msg_type = rng.choice(mix)
+        if msg_type == 5:
+            seq_id = (seq_id + 1) % 10
+            message = _encode({
+                "type": 5, "mmsi": mmsi, "shipname": f"NAVE {mmsi % 10000}", "callsign": f"I{mmsi % 1000:03d}",
+                "ship_type": 70, "imo": 9000000 + mmsi % 100000, "to_bow": 100, "to_stern": 20,
+                "to_port": 10, "to_starboard": 10, "destination": "LIVORNO",
+            }, seq_id=seq_id, radio_channel=rng.choice("AB"))
+        elif msg_type == 24:
+            if rng.random() < 0.5:
+                message = _encode({"type": 24, "mmsi": mmsi, "partno": 0, "shipname": f"DIPORTO {mmsi % 1000}"})
+            else:
+                message = _encode({"type": 24, "mmsi": mmsi, "partno": 1, "ship_type": 37, "callsign": "IXYZ"})
+        elif msg_type in _OTHER_TYPES:
+            message = _encode(dict(_OTHER_TYPES[msg_type], type=msg_type, mmsi=mmsi,
+                                   lat=round(rng.uniform(lat_min, lat_max), 5),
+                                   lon=round(rng.uniform(lon_min, lon_max), 5)), radio_channel=rng.choice("AB"))
+        else:
+            message = _encode({
+                "type": msg_type, "mmsi": mmsi,
+                "lat": round(rng.uniform(lat_min, lat_max), 5), "lon": round(rng.uniform(lon_min, lon_max), 5),
+                "speed": round(rng.uniform(0, 25), 1), "course": round(rng.uniform(0, 359), 1),
+                "heading": rng.randrange(360), "status": 0,
+            }, radio_channel=rng.choice("AB"))
+        messages.append(message[0] if len(message) == 1 else message)
+    return messages
+
+
+def synthetic_sentences(count, **kwargs):
+    """Come ``synthetic_messages`` ma appiattito in singole sentenze NMEA, nell'ordine di trasmissione."""
+    sentences = []
+    for message in synthetic_messages(count, **kwargs):
+        if isinstance(message, list):
+            sentences.extend(message)
+        else:
+            sentences.append(message)
+    return sentences
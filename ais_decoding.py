@@ -0,0 +1,143 @@
+import time
+
+from pyais import decode
+
+from ais_projectors import DEFAULT_PROJECTORS
+
+
+# Timeout predefinito per i frammenti multi-part, come nell'assembler di pyais
+ASSEMBLER_TIMEOUT = 1.0
+
+# Caratteri ASCII del payload "armored" a 6 bit -> valore (0-39 da '0' a 'W', 40-63 da '`' a 'w')
+_SIXBIT = {chr(code): code - 48 for code in range(48, 88)}
+_SIXBIT.update({chr(code): code - 56 for code in range(96, 120)})
+
+
+def payload_bits(payload, count):
+    """Primi ``count`` bit di un payload AIS "armored" come intero, senza decodificare il messaggio.
+
+    Restituisce None se il payload è più corto o contiene caratteri non validi.
+    """
+    chars = -(-count // 6)
+    if len(payload) < chars:
+        return None
+    bits = 0
+    try:
+        for char in payload[:chars]:
+            bits = (bits << 6) | _SIXBIT[char]
+    except KeyError:
+        return None
+    return bits >> (chars * 6 - count)
+
+
+class MultipartAssembler:
+    """Ricompone i messaggi AIS multi-part (es. tipo 5) a partire dalle singole sentenze.
+
+    ``assemble()`` restituisce la sentenza stessa per i messaggi in un solo
+    frammento, una lista ordinata di sentenze quando un multi-part è
+    completo e ``None`` mentre mancano ancora dei frammenti. I frammenti più
+    vecchi di ``timeout`` secondi vengono scartati e contati in ``timeouts``.
+    Va usata un'istanza per sorgente: i sequence id di due Moxa diversi si
+    sovrappongono.
+    """
+
+    def __init__(self, timeout=ASSEMBLER_TIMEOUT):
+        self.timeout = timeout
+        self.timeouts = 0
+        # (seq_id, canale) -> [istante primo frammento, numero totale, {numero frammento: sentenza}]
+        self._pending = {}
+
+    @property
+    def pending_fragments(self):
+        # list(): può essere letta dal thread delle metriche mentre il lettore aggiorna il dict
+        return sum(len(entry[2]) for entry in list(self._pending.values()))
+
+    def assemble(self, sentence, now=None):
+        fields = sentence.split(",", 5)
+        if len(fields) < 6 or fields[0][3:6] not in ("VDM", "VDO"):
+            # Non è una sentenza AIS (es. $GPRMC): la lasciamo al decoder così com'è
+            return sentence
+        total = int(fields[1])
+        if total <= 1:
+            return sentence
+
+        number = int(fields[2])
+        key = (fields[3], fields[4])
+        now = time.monotonic() if now is None else now
+        if self._pending:
+            self.expire(now)
+        entry = self._pending.get(key)
+        if entry is None or entry[1] != total or number in entry[2]:
+            if entry is not None:
+                # Un nuovo messaggio riusa lo stesso sequence id: il precedente è incompleto
+                self.timeouts += 1
+            entry = self._pending[key] = [now, total, {}]
+        entry[2][number] = sentence
+        if len(entry[2]) < total:
+            return None
+        del self._pending[key]
+        fragments = entry[2]
+        return [fragments[part] for part in sorted(fragments)]
+
+    def expire(self, now=None):
+        now = time.monotonic() if now is None else now
+        expired = [key for key, entry in self._pending.items() if now - entry[0] > self.timeout]
+        for key in expired:
+            del self._pending[key]
+        self.timeouts += len(expired)
+        return len(expired)
+
+
+try:
+    from pyais.messages import NMEAMessageAssembler
+except ImportError:
+    # Le versioni di pyais pubblicate su PyPI non includono un assembler: usiamo il nostro
+    NMEAMessageAssembler = MultipartAssembler
+
+
+def decode_assembled(assembled_message):
+    # L'assembler restituisce una stringa per i messaggi singoli e una lista di frammenti per i multi-part
+    if isinstance(assembled_message, (list, tuple)):
+        return decode(*assembled_message)
+    return decode(assembled_message)
+
+
+def build_log_data(assembled_message, decoded_ais_message, timestamp=None, projectors=DEFAULT_PROJECTORS):
+    # Record JSON di un messaggio decodificato (stesso schema dei log "DECODED AIS (JSON)").
+    # I campi dipendono dal tipo secondo FIELD_TABLE (vedi ais_projectors.py)
+    return {
+        "timestamp": time.time() if timestamp is None else timestamp,
+        "raw_nmea": assembled_message, # Logga il messaggio completo assemblato
+        "msg_type": decoded_ais_message.msg_type,
+        "mmsi": decoded_ais_message.mmsi,
+        "decoded_fields": projectors.project(decoded_ais_message),
+    }
+
+
+def decode_log_data(assembled_message, timestamp=None, projectors=DEFAULT_PROJECTORS):
+    """Decodifica un messaggio assemblato e ne costruisce il record; None se pyais non restituisce nulla.
+
+    Tipo e MMSI vengono letti prima dai bit del payload: i tipi senza campi
+    selezionati (``projectors.skipped_types``) non passano da pyais e hanno
+    "decoded_fields" vuoto, il messaggio resta decodificabile da "raw_nmea".
+    Le eccezioni di pyais si propagano come con ``decode_assembled``.
+    """
+    if projectors.skipped_types:
+        first = assembled_message[0] if isinstance(assembled_message, (list, tuple)) else assembled_message
+        fields = first.split(",", 6)
+        # Il primo carattere del payload (6 bit) è il tipo: i bit dell'MMSI si leggono solo per i tipi saltati
+        msg_type = _SIXBIT.get(fields[5][:1]) if len(fields) > 6 else None
+        # 38 bit letti: tipo (6) + repeat (2) + MMSI (30)
+        bits = payload_bits(fields[5], 38) if msg_type in projectors.skipped_types else None
+        if bits is not None:
+            return {
+                "timestamp": time.time() if timestamp is None else timestamp,
+                "raw_nmea": assembled_message,
+                "msg_type": msg_type,
+                "mmsi": bits & 0x3FFFFFFF,
+                "decoded_fields": {},
+            }
+    decoded_ais_message = decode_assembled(assembled_message)
+    if not decoded_ais_message:
+        return None
+    return build_log_data(assembled_message, decoded_ais_message, timestamp, projectors)
@@ -0,0 +1,235 @@
+import collections
+import os
+import time
+
+from ais_metrics import REGISTRY
+from ais_decoding import payload_bits
+from vessel_registry import haversine_m
+
+
+# --- CONFIGURAZIONE DEL FILTRO PRIMA DELLA DECODIFICA ---
+# Finestra in cui un payload identico è considerato un duplicato (0 = deduplicazione disattivata).
+# Senza AIS_DEDUP_WINDOW la deduplicazione è attiva solo con più ricevitori: con un solo Moxa un
+# payload ripetuto è un messaggio legittimo (es. un report statico ritrasmesso identico)
+DEDUP_WINDOW = float(os.environ["AIS_DEDUP_WINDOW"]) if os.environ.get("AIS_DEDUP_WINDOW") else None
+MULTI_SOURCE_DEDUP_WINDOW = 5.0
+DEDUP_MAX_ENTRIES = int(os.environ.get("AIS_DEDUP_MAX_ENTRIES", "100000"))
+# Diradamento delle posizioni per MMSI: al massimo un report ogni THIN_MIN_INTERVAL secondi,
+# salvo spostamenti di almeno THIN_MIN_DISTANCE metri. Con la sola distanza passa solo chi si è
+# spostato di THIN_MIN_DISTANCE metri dall'ultimo report inoltrato (0 e 0 = diradamento disattivato)
+THIN_MIN_INTERVAL = float(os.environ.get("AIS_THIN_INTERVAL", "0"))
+THIN_MIN_DISTANCE = float(os.environ.get("AIS_THIN_DISTANCE", "0"))
+# Con la sola distanza, dopo quanti secondi senza report inoltrati una nave ferma passa di nuovo
+THIN_STATE_MAX_AGE = 3600
+
+# Tipo di messaggio -> bit di inizio della longitudine (28 bit con segno, latitudine a 27 bit subito dopo)
+_POSITION_LON_BIT = {1: 61, 2: 61, 3: 61, 18: 57}
+_POSITION_SCALE = 600000.0      # 1/10000 di minuto
+
+
+def _signed(value, bits):
+    return value - (1 << bits) if value & (1 << (bits - 1)) else value
+
+
+def position_from_payload(payload):
+    """MMSI, latitudine e longitudine di un report di posizione (tipi 1/2/3/18) letti dal payload.
+
+    Non decodifica il messaggio: legge solo i bit necessari. Restituisce
+    None per gli altri tipi o per payload illeggibili; lat/lon sono None
+    quando la posizione non è disponibile (91/181 nel protocollo).
+    """
+    msg_type = payload_bits(payload, 6)
+    lon_bit = _POSITION_LON_BIT.get(msg_type)
+    if lon_bit is None:
+        return None
+    end = lon_bit + 55
+    bits = payload_bits(payload, end)
+    if bits is None:
+        return None
+    mmsi = (bits >> (end - 38)) & 0x3FFFFFFF
+    lat = _signed(bits & 0x7FFFFFF, 27) / _POSITION_SCALE
+    lon = _signed((bits >> 27) & 0xFFFFFFF, 28) / _POSITION_SCALE
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0):
+        return mmsi, None, None
+    return mmsi, lat, lon
+
+
+def default_dedup_window(sources):
+    # AIS_DEDUP_WINDOW se impostata, altrimenti MULTI_SOURCE_DEDUP_WINDOW solo con più sorgenti
+    if DEDUP_WINDOW is not None:
+        return DEDUP_WINDOW
+    return MULTI_SOURCE_DEDUP_WINDOW if sources > 1 else 0
+
+
+def message_payload(assembled_message):
+    # Payload del messaggio assemblato (frammenti concatenati per i multi-part); None se non è AIS
+    if isinstance(assembled_message, (list, tuple)):
+        payloads = [message_payload(sentence) for sentence in assembled_message]
+        return None if None in payloads else "".join(payloads)
+    fields = assembled_message.split(",", 6)
+    return fields[5] if len(fields) > 6 else None
+
+
+class DuplicateFilter:
+    """Insieme limitato dei payload visti di recente, con scadenza a tempo.
+
+    Con più ricevitori che coprono la stessa zona la stessa sentenza arriva
+    più volte (con intestazioni diverse ma payload identico): un payload già
+    visto negli ultimi ``window`` secondi è un duplicato. Le chiavi scadono
+    in ordine di arrivo da una deque; oltre ``max_entries`` si scartano le
+    più vecchie anche se la finestra non è trascorsa (contate in ``evicted``).
+    """
+
+    def __init__(self, window=MULTI_SOURCE_DEDUP_WINDOW, max_entries=DEDUP_MAX_ENTRIES):
+        self.window = window
+        self.max_entries = max_entries
+        self._seen = set()
+        # (istante, payload) in ordine di arrivo: ogni payload in _seen ha esattamente una voce
+        self._expiry = collections.deque()
+
+        # Statistiche
+        self.checked = 0
+        self.duplicates = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._seen)
+
+    def expire(self, now):
+        expiry = self._expiry
+        limit = now - self.window
+        while expiry and expiry[0][0] < limit:
+            self._seen.discard(expiry.popleft()[1])
+
+    def is_duplicate(self, payload, now):
+        self.checked += 1
+        self.expire(now)
+        if payload in self._seen:
+            self.duplicates += 1
+            return True
+        if len(self._expiry) >= self.max_entries:
+            self._seen.discard(self._expiry.popleft()[1])
+            self.evicted += 1
+        self._seen.add(payload)
+        self._expiry.append((now, payload))
+        return False
+
+
+class PositionThinner:
+    """Dirada i report di posizione di ogni MMSI.
+
+    Le navi in classe A trasmettono ogni 2-10 secondi: un report arrivato
+    meno di ``min_interval`` secondi dopo l'ultimo inoltrato per lo stesso
+    MMSI viene scartato, a meno che la nave non si sia spostata di almeno
+    ``min_distance`` metri (0 = solo intervallo). Con ``min_interval`` 0 si
+    dirada solo per distanza: passa un report ogni ``min_distance`` metri
+    percorsi, e uno ogni ``THIN_STATE_MAX_AGE`` secondi per le navi ferme.
+    Gli altri tipi di messaggio passano sempre.
+    """
+
+    def __init__(self, min_interval=THIN_MIN_INTERVAL, min_distance=THIN_MIN_DISTANCE):
+        self.min_interval = min_interval
+        self.min_distance = min_distance
+        # MMSI -> (istante, lat, lon) dell'ultimo report inoltrato
+        self._last = {}
+
+        # Statistiche
+        self.checked = 0
+        self.thinned = 0
+
+    def __len__(self):
+        return len(self._last)
+
+    def should_drop(self, payload, now):
+        position = position_from_payload(payload)
+        if position is None:
+            return False
+        self.checked += 1
+        mmsi, lat, lon = position
+        last = self._last.get(mmsi)
+        if last is not None and now - last[0] < (self.min_interval or THIN_STATE_MAX_AGE):
+            if not (self.min_distance and self._moved(lat, lon, last)):
+                self.thinned += 1
+                return True
+        self._last[mmsi] = (now, lat, lon)
+        return False
+
+    def _moved(self, lat, lon, last):
+        if lat is None:
+            return False
+        if last[1] is None:
+            # Prima posizione valida dopo report senza posizione
+            return True
+        return haversine_m(lat, lon, last[1], last[2]) >= self.min_distance
+
+    def expire(self, now):
+        # Le navi non sentite da più di min_interval passerebbero comunque: il loro stato non serve più
+        limit = now - (self.min_interval or THIN_STATE_MAX_AGE)
+        stale = [mmsi for mmsi, last in self._last.items() if last[0] < limit]
+        for mmsi in stale:
+            del self._last[mmsi]
+        return len(stale)
+
+
+class MessageFilter:
+    """Stadio tra ``NMEAMessageAssembler`` e la decodifica.
+
+    ``accept()`` riceve il messaggio assemblato e dice se va decodificato:
+    prima la deduplicazione dei payload, poi (se attivo) il diradamento
+    delle posizioni. Lavora sui caratteri del payload, quindi costa molto
+    meno della decodifica pyais che evita. Un'istanza sola per tutte le
+    sorgenti, perché i duplicati arrivano proprio da ricevitori diversi.
+    Senza ``dedup_window`` esplicita la finestra dipende da ``sources``
+    (vedi ``default_dedup_window``).
+    """
+
+    def __init__(self, dedup_window=None, dedup_max_entries=DEDUP_MAX_ENTRIES,
+                 thin_interval=THIN_MIN_INTERVAL, thin_distance=THIN_MIN_DISTANCE, sources=1):
+        if dedup_window is None:
+            dedup_window = default_dedup_window(sources)
+        self.dedup = DuplicateFilter(dedup_window, dedup_max_entries) if dedup_window > 0 else None
+        self.thinner = (PositionThinner(thin_interval, thin_distance)
+                        if thin_interval > 0 or thin_distance > 0 else None)
+        self.passed = 0
+
+    def accept(self, assembled_message, now=None):
+        if self.dedup is None and self.thinner is None:
+            self.passed += 1
+            return True
+        payload = message_payload(assembled_message)
+        if payload is None:
+            # Non è un messaggio AIS leggibile: lo lasciamo al decoder, che lo segnalerà
+            self.passed += 1
+            return True
+        now = time.monotonic() if now is None else now
+        if self.dedup is not None and self.dedup.is_duplicate(payload, now):
+            return False
+        if self.thinner is not None and self.thinner.should_drop(payload, now):
+            return False
+        self.passed += 1
+        return True
+
+    def expire(self, now=None):
+        now = time.monotonic() if now is None else now
+        if self.dedup is not None:
+            self.dedup.expire(now)
+        if self.thinner is not None:
+            self.thinner.expire(now)
+
+    def stats(self):
+        stats = {"passed": self.passed}
+        if self.dedup is not None:
+            stats["dedup"] = {"checked": self.dedup.checked, "duplicates": self.dedup.duplicates,
+                              "tracked": len(self.dedup), "evicted": self.dedup.evicted}
+        if self.thinner is not None:
+            stats["thinning"] = {"checked": self.thinner.checked, "thinned": self.thinner.thinned,
+                                 "tracked": len(self.thinner)}
+        return stats
+
+
+def register_filter_metrics(message_filter):
+    # Contatori del filtro letti solo allo scrape dell'endpoint delle metriche
+    REGISTRY.callback("ais_filter_dropped_total", "Messaggi scartati prima della decodifica, per stadio.",
+                      lambda: [(("dedup",), message_filter.dedup.duplicates if message_filter.dedup else None),
+                               (("thinning",), message_filter.thinner.thinned if message_filter.thinner else None)],
+                      kind="counter", labelnames=["stage"])
@@ -0,0 +1,361 @@
+import asyncio
+import collections
+import json
+import logging
+import os
+import random
+import time
+
+from pyais.exceptions import UnknownMessageException, MissingMultipartMessageException
+
+from ais_decoding import NMEAMessageAssembler, decode_log_data
+from ais_dedup import MessageFilter, register_filter_metrics
+from ais_metrics import (REGISTRY, BYTES_RECEIVED, SENTENCES_RECEIVED, NON_NMEA_LINES, BUFFER_OVERFLOWS,
+                         DECODED_MESSAGES, DECODE_ERRORS, STAGE_LATENCY, start_metrics_server)
+from ais_output import OUTPUT_FORMAT, AISOutputWriter
+from nmea_framer import NMEAFramer
+from vessel_registry import VesselRegistry
+
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURAZIONE PREDEFINITA DEL MOTORE DI INGESTIONE ---
+QUEUE_SIZE = 10000          # sentenze in coda prima di applicare backpressure ai ricevitori
+READ_SIZE = 64 * 1024
+CONNECT_TIMEOUT = 5         # come il vecchio sock.settimeout(5)
+IDLE_TIMEOUT = 60           # secondi senza dati prima di considerare il ricevitore bloccato
+RECONNECT_MIN_DELAY = 1
+RECONNECT_MAX_DELAY = 60
+STATS_INTERVAL = 30
+# Directory dell'output decodificato (come test_ok.py)
+STORAGE_DIRECTORY = os.environ.get("AIS_STORAGE_DIR", "/app/storage")
+
+# Un ricevitore Moxa da leggere: source_id viene allegato a ogni sentenza
+MoxaEndpoint = collections.namedtuple("MoxaEndpoint", ["source_id", "host", "port"])
+
+# Elemento della coda condivisa
+SourcedSentence = collections.namedtuple("SourcedSentence", ["source_id", "received_at", "sentence"])
+
+
+def parse_endpoint(spec):
+    # Formati accettati: "host:porta" oppure "id=host:porta"
+    source_id, _, address = spec.strip().rpartition("=")
+    host, _, port_str = address.rpartition(":")
+    if not host or not port_str:
+        raise ValueError(f"Endpoint non valido '{spec}'. Formato atteso: [id=]host:porta")
+    port = int(port_str)
+    if not (0 <= port <= 65535):
+        raise ValueError(f"La porta {port_str} non è valida. Deve essere tra 0 e 65535.")
+    return MoxaEndpoint(source_id or f"{host}:{port}", host, port)
+
+
+def load_endpoints(config_path=None, environ=os.environ):
+    """Legge l'elenco dei Moxa da file JSON o da variabili d'ambiente.
+
+    Ordine di precedenza:
+      1. ``config_path`` o ``MOXA_CONFIG``: file JSON ``{"endpoints": [{"id": ..., "host": ..., "port": ...}]}``
+      2. ``MOXA_ENDPOINTS``: ``nord=192.168.1.100:10001,sud=192.168.1.101:10001``
+      3. ``MOXA_IP`` + ``MOXA_PORT``: un solo ricevitore
+    """
+    config_path = config_path or environ.get("MOXA_CONFIG")
+    if config_path:
+        with open(config_path, encoding="utf-8") as config_file:
+            config = json.load(config_file)
+        endpoints = []
+        for entry in config.get("endpoints", []):
+            port = int(entry["port"])
+            endpoints.append(MoxaEndpoint(entry.get("id") or f"{entry['host']}:{port}", entry["host"], port))
+        return endpoints
+
+    if environ.get("MOXA_ENDPOINTS"):
+        return [parse_endpoint(spec) for spec in environ["MOXA_ENDPOINTS"].split(",") if spec.strip()]
+
+    if environ.get("MOXA_IP") and environ.get("MOXA_PORT"):
+        return [parse_endpoint(f"{environ['MOXA_IP']}:{environ['MOXA_PORT']}")]
+
+    return []
+
+
+class ReceiverStats:
+    # Contatori per singola connessione, aggiornati solo dal task del ricevitore
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.connected = False
+        self.connects = 0
+        self.reconnects = 0
+        self.bytes_received = 0
+        self.sentences = 0
+        self.non_nmea_lines = 0
+        self.overflows = 0
+        self.last_error = None
+        self.last_data_at = None
+        self._rate_at = time.monotonic()
+        self._rate_bytes = 0
+        self._rate_sentences = 0
+
+    def snapshot(self):
+        # Restituisce i contatori e la velocità media dall'ultimo snapshot
+        now = time.monotonic()
+        elapsed = max(now - self._rate_at, 1e-9)
+        snapshot = {
+            "source_id": self.endpoint.source_id,
+            "address": f"{self.endpoint.host}:{self.endpoint.port}",
+            "connected": self.connected,
+            "connects": self.connects,
+            "reconnects": self.reconnects,
+            "bytes_received": self.bytes_received,
+            "sentences": self.sentences,
+            "non_nmea_lines": self.non_nmea_lines,
+            "overflows": self.overflows,
+            "bytes_per_sec": (self.bytes_received - self._rate_bytes) / elapsed,
+            "sentences_per_sec": (self.sentences - self._rate_sentences) / elapsed,
+            "last_error": self.last_error,
+        }
+        self._rate_at = now
+        self._rate_bytes = self.bytes_received
+        self._rate_sentences = self.sentences
+        return snapshot
+
+
+class AISIngestEngine:
+    """Legge tutti i Moxa configurati in un unico event loop.
+
+    Ogni ricevitore ha il suo task: si riconnette con backoff esponenziale
+    e jitter, e inserisce le sentenze nella coda condivisa ``queue`` come
+    ``SourcedSentence``. Quando la coda è piena il task smette di leggere
+    dal socket (backpressure TCP verso il Moxa) senza bloccare gli altri.
+    """
+
+    def __init__(self, endpoints, queue_size=QUEUE_SIZE, connect_timeout=CONNECT_TIMEOUT,
+                 idle_timeout=IDLE_TIMEOUT, reconnect_min_delay=RECONNECT_MIN_DELAY,
+                 reconnect_max_delay=RECONNECT_MAX_DELAY):
+        if not endpoints:
+            raise ValueError("Nessun endpoint Moxa configurato.")
+        source_ids = [endpoint.source_id for endpoint in endpoints]
+        if len(set(source_ids)) != len(source_ids):
+            raise ValueError(f"Identificativi sorgente duplicati: {source_ids}")
+        self.endpoints = list(endpoints)
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.connect_timeout = connect_timeout
+        self.idle_timeout = idle_timeout
+        self.reconnect_min_delay = reconnect_min_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.receivers = {endpoint.source_id: ReceiverStats(endpoint) for endpoint in self.endpoints}
+        self._tasks = []
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "receivers": [receiver.snapshot() for receiver in self.receivers.values()],
+        }
+
+    def start(self):
+        # Avvia un task per ricevitore; va chiamato dall'interno dell'event loop
+        for endpoint in self.endpoints:
+            task = asyncio.create_task(self._run_receiver(endpoint), name=f"moxa-{endpoint.source_id}")
+            self._tasks.append(task)
+        return self._tasks
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def _backoff_delay(self, attempt):
+        # Backoff esponenziale con jitter, per evitare che tutti i ricevitori si riconnettano insieme
+        delay = min(self.reconnect_max_delay, self.reconnect_min_delay * (2 ** attempt))
+        return random.uniform(delay / 2, delay)
+
+    async def _run_receiver(self, endpoint):
+        stats = self.receivers[endpoint.source_id]
+        attempt = 0
+        while True:
+            writer = None
+            bytes_before = stats.bytes_received
+            try:
+                logger.info(f"[{endpoint.source_id}] Tentativo di connessione a {endpoint.host}:{endpoint.port}...")
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(endpoint.host, endpoint.port), self.connect_timeout)
+                stats.connected = True
+                stats.connects += 1
+                if stats.connects > 1:
+                    stats.reconnects += 1
+                logger.info(f"[{endpoint.source_id}] Connessione stabilita con successo!")
+                await self._read_stream(endpoint, stats, reader)
+                logger.warning(f"[{endpoint.source_id}] Connessione chiusa dal Moxa.")
+            except asyncio.CancelledError:
+                raise
+            except ConnectionRefusedError:
+                stats.last_error = "ConnectionRefusedError"
+                logger.error(f"[{endpoint.source_id}] Errore: Connessione rifiutata da {endpoint.host}:{endpoint.port}.")
+            except asyncio.TimeoutError:
+                stats.last_error = "TimeoutError"
+                logger.error(f"[{endpoint.source_id}] Errore: Timeout verso {endpoint.host}:{endpoint.port} (connessione o nessun dato da {self.idle_timeout}s).")
+            except OSError as e:
+                stats.last_error = type(e).__name__
+                logger.error(f"[{endpoint.source_id}] Errore di rete: {e}")
+            finally:
+                stats.connected = False
+                if writer is not None:
+                    writer.close()
+
+            if stats.bytes_received > bytes_before:
+                # La connessione ha prodotto dati: riparte il backoff
+                attempt = 0
+            delay = self._backoff_delay(attempt)
+            attempt += 1
+            logger.info(f"[{endpoint.source_id}] Nuovo tentativo tra {delay:.1f}s.")
+            await asyncio.sleep(delay)
+
+    async def _read_stream(self, endpoint, stats, reader):
+        source_id = endpoint.source_id
+        queue = self.queue
+        bytes_received = BYTES_RECEIVED.labels(source_id)
+        sentences_received = SENTENCES_RECEIVED.labels(source_id)
+        non_nmea_lines = NON_NMEA_LINES.labels(source_id)
+        buffer_overflows = BUFFER_OVERFLOWS.labels(source_id)
+
+        def on_overflow(dropped):
+            buffer_overflows.inc()
+            logger.warning(f"[{source_id}] ATTENZIONE: {len(dropped)} bytes senza delimitatori, riga scartata.")
+
+        framer = NMEAFramer(on_overflow=on_overflow)
+        while True:
+            data = await asyncio.wait_for(reader.read(READ_SIZE), self.idle_timeout)
+            if not data:
+                return
+            now = time.time()
+            stats.bytes_received += len(data)
+            stats.last_data_at = now
+            bytes_received.inc(len(data))
+            sentences_before, non_nmea_before = stats.sentences, stats.non_nmea_lines
+            for line in framer.feed(data):
+                sentence = str(line, "ascii", errors="ignore").strip()
+                if sentence.startswith(("!", "$")):
+                    stats.sentences += 1
+                    # put() attende se la coda è piena: è qui che si applica la backpressure
+                    await queue.put(SourcedSentence(source_id, now, sentence))
+                else:
+                    stats.non_nmea_lines += 1
+            stats.overflows = framer.overflow_count
+            sentences_received.inc(stats.sentences - sentences_before)
+            if stats.non_nmea_lines != non_nmea_before:
+                non_nmea_lines.inc(stats.non_nmea_lines - non_nmea_before)
+
+
+async def decode_from_engine(engine, message_filter, handle):
+    """Consuma la coda del motore: assemblaggio, filtro e decodifica, poi ``handle(log_data)`` per ogni messaggio.
+
+    Un assembler per sorgente: i sequence id dei multi-part si sovrappongono
+    tra Moxa diversi. Il filtro invece è unico, perché i duplicati arrivano
+    proprio da ricevitori diversi. ``log_data`` ha in più ``source_id``.
+    """
+    assemblers = collections.defaultdict(NMEAMessageAssembler)
+    assembly_latency = STAGE_LATENCY.labels("assembly")
+    decode_latency = STAGE_LATENCY.labels("decode")
+    while True:
+        item = await engine.queue.get()
+        try:
+            started = time.perf_counter()
+            assembled_message = assemblers[item.source_id].assemble(item.sentence)
+            assembly_latency.observe(time.perf_counter() - started)
+            if not assembled_message or not message_filter.accept(assembled_message, item.received_at):
+                continue
+            started = time.perf_counter()
+            log_data = decode_log_data(assembled_message, item.received_at)
+            decode_latency.observe(time.perf_counter() - started)
+        except (UnknownMessageException, MissingMultipartMessageException) as e:
+            DECODE_ERRORS.labels(type(e).__name__).inc()
+            logger.warning(f"[{item.source_id}] AVVISO: messaggio non decodificabile: {item.sentence} - {e}")
+            continue
+        except Exception as e:
+            DECODE_ERRORS.labels(type(e).__name__).inc()
+            logger.error(f"[{item.source_id}] ERRORE durante la decodifica di '{item.sentence}': {e}")
+            continue
+        if log_data is not None:
+            DECODED_MESSAGES.labels(log_data["msg_type"]).inc()
+            log_data["source_id"] = item.source_id
+            handle(log_data)
+
+
+async def _log_stats(engine, message_filter, vessel_registry, interval):
+    while True:
+        await asyncio.sleep(interval)
+        stats = engine.stats()
+        logger.info(f"Coda: {stats['queue_depth']}/{stats['queue_size']}")
+        for receiver in stats["receivers"]:
+            logger.info(f"[{receiver['source_id']}] connesso={receiver['connected']} "
+                        f"riconnessioni={receiver['reconnects']} "
+                        f"{receiver['sentences_per_sec']:.1f} sentenze/s {receiver['bytes_per_sec']:.0f} B/s")
+        removed = vessel_registry.expire()
+        logger.info(f"Navi tracciate: {len(vessel_registry)} (rimosse per inattività: {removed})")
+        message_filter.expire(time.time())
+        logger.info(f"Filtro messaggi: {message_filter.stats()}")
+
+
+def register_engine_metrics(engine, output_writer=None):
+    # Letti solo allo scrape dell'endpoint delle metriche
+    REGISTRY.callback("ais_queue_depth", "Elementi in attesa nelle code interne.",
+                      lambda: [(("ingest",), engine.queue.qsize()),
+                               (("output",), output_writer.queue_depth if output_writer is not None else None)],
+                      labelnames=["queue"])
+    REGISTRY.callback("ais_receiver_connected", "1 se il ricevitore è connesso.",
+                      lambda: [((stats.endpoint.source_id,), int(stats.connected))
+                               for stats in engine.receivers.values()],
+                      labelnames=["source"])
+    REGISTRY.callback("ais_receiver_reconnects_total", "Riconnessioni per ricevitore.",
+                      lambda: [((stats.endpoint.source_id,), stats.reconnects)
+                               for stats in engine.receivers.values()],
+                      kind="counter", labelnames=["source"])
+
+
+async def run_engine(endpoints, stats_interval=STATS_INTERVAL, output_directory=STORAGE_DIRECTORY):
+    engine = AISIngestEngine(endpoints)
+    message_filter = MessageFilter(sources=len(engine.endpoints))
+    vessel_registry = VesselRegistry()
+    # Output strutturato (NDJSON o binario) scritto a batch da un thread dedicato
+    output_writer = AISOutputWriter(output_directory) if OUTPUT_FORMAT != "none" else None
+    if output_writer is not None:
+        logger.info(f"I messaggi decodificati verranno scritti in {output_writer.path}")
+
+    def handle(log_data):
+        vessel_registry.apply(log_data)
+        if output_writer is not None:
+            output_writer.write(log_data)
+
+    register_engine_metrics(engine, output_writer)
+    register_filter_metrics(message_filter)
+    REGISTRY.callback("ais_vessels_tracked", "Navi nel registro in memoria.", lambda: len(vessel_registry))
+    engine.start()
+    stats_task = asyncio.create_task(_log_stats(engine, message_filter, vessel_registry, stats_interval))
+    try:
+        await decode_from_engine(engine, message_filter, handle)
+    finally:
+        stats_task.cancel()
+        await engine.stop()
+        logger.info(f"Filtro messaggi: {message_filter.stats()}")
+        if output_writer is not None:
+            # close() attende il thread di scrittura: fuori dall'event loop
+            await asyncio.get_running_loop().run_in_executor(None, output_writer.close)
+            logger.info(f"Output chiuso: {output_writer.written} record scritti, {output_writer.dropped} scartati.")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    endpoints = load_endpoints()
+    if not endpoints:
+        logger.critical("Nessun Moxa configurato. Impostare MOXA_CONFIG, MOXA_ENDPOINTS oppure MOXA_IP e MOXA_PORT.")
+        return
+    logger.info(f"Avvio ingestione da {len(endpoints)} ricevitori: {', '.join(e.source_id for e in endpoints)}")
+    start_metrics_server()
+    try:
+        asyncio.run(run_engine(endpoints))
+    except KeyboardInterrupt:
+        logger.info("Interrotto dall'utente.")
+
+
+if __name__ == "__main__":
+    main()
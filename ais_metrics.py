@@ -0,0 +1,308 @@
+from bisect import bisect_left
+import logging
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURAZIONE DELL'ENDPOINT DELLE METRICHE ---
+METRICS_HOST = os.environ.get("AIS_METRICS_HOST", "0.0.0.0")
+METRICS_PORT = int(os.environ.get("AIS_METRICS_PORT", "9108"))     # 0 = endpoint disattivato
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Limiti dei bucket di latenza (secondi): dal µs del framing al secondo di un batch di output lento
+LATENCY_BUCKETS = (5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2,
+                   0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _PerThreadValues:
+    """Valori di una metrica divisi per thread.
+
+    Ogni thread scrive solo nel suo dict (nessun lock nel percorso caldo);
+    i dict di tutti i thread, anche terminati, vengono sommati solo quando
+    l'endpoint viene letto.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+
+    def shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def shards(self):
+        with self._lock:
+            shards = list(self._shards)
+        # copy() è atomica rispetto agli altri thread: si legge una fotografia di ogni dict
+        return [shard.copy() for shard in shards]
+
+
+class _CounterChild:
+    __slots__ = ("_key", "_values", "_local")
+
+    def __init__(self, key, values):
+        self._key = key
+        self._values = values
+        self._local = values._local
+
+    def inc(self, amount=1):
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._values.shard()
+        shard[self._key] = shard.get(self._key, 0) + amount
+
+
+class _HistogramChild:
+    __slots__ = ("_key", "_values", "_local", "_buckets")
+
+    def __init__(self, key, values, buckets):
+        self._key = key
+        self._values = values
+        self._local = values._local
+        self._buckets = buckets
+
+    def observe(self, value, count=1):
+        try:
+            entry = self._local.shard[self._key]
+        except (AttributeError, KeyError):
+            # Conteggi per bucket (non cumulativi, l'ultimo è +Inf) e in coda la somma dei valori
+            entry = self._values.shard()[self._key] = [0] * (len(self._buckets) + 2)
+        entry[bisect_left(self._buckets, value)] += count
+        entry[-1] += value * count
+
+    def merge(self, counts):
+        """Somma osservazioni già raggruppate altrove (es. in un processo worker).
+
+        ``counts`` ha la stessa forma dello stato interno: un conteggio per
+        bucket (l'ultimo è +Inf) e in coda la somma dei valori.
+        """
+        try:
+            entry = self._local.shard[self._key]
+        except (AttributeError, KeyError):
+            entry = self._values.shard()[self._key] = [0] * (len(self._buckets) + 2)
+        for index, value in enumerate(counts):
+            entry[index] += value
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = _PerThreadValues()
+        self._children = {}
+
+    def labels(self, *values):
+        """Serie con i valori di etichetta dati; conviene conservarla invece di richiederla per ogni evento."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name}: attese le etichette {self.labelnames}, ricevuto {values}")
+            # 1 e "1" finiscono nella stessa serie
+            child = self._children[values] = self._child(tuple(str(value) for value in values))
+        return child
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _child(self, key):
+        return _CounterChild(key, self._values)
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def expose(self):
+        totals = {}
+        for shard in self._values.shards():
+            for key, value in shard.items():
+                totals[key] = totals.get(key, 0) + value
+        lines = self._header()
+        for key in sorted(totals):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(totals[key])}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _child(self, key):
+        return _HistogramChild(key, self._values, self.buckets)
+
+    def observe(self, value, count=1):
+        self.labels().observe(value, count)
+
+    def expose(self):
+        totals = {}
+        for shard in self._values.shards():
+            for key, entry in shard.items():
+                entry = list(entry)
+                total = totals.get(key)
+                totals[key] = entry if total is None else [a + b for a, b in zip(total, entry)]
+        lines = self._header()
+        bounds = [_format_value(bound) for bound in self.buckets] + ["+Inf"]
+        for key in sorted(totals):
+            entry = totals[key]
+            cumulative = 0
+            for bound, count in zip(bounds, entry):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(entry[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class CallbackMetric:
+    """Metrica letta solo al momento dello scrape (profondità delle code, frammenti in attesa...).
+
+    ``function`` restituisce un numero oppure, con ``labelnames``, coppie
+    ``(valori_etichette, valore)``. Va bene anche per contatori che un
+    oggetto tiene già (es. ``assembler.timeouts``): nessun costo nel
+    percorso caldo.
+    """
+
+    def __init__(self, name, documentation, kind, function, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.function = function
+        self.labelnames = tuple(labelnames)
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        result = self.function()
+        samples = [((), result)] if not self.labelnames else result
+        for values, value in samples:
+            if value is None:
+                continue
+            lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _register(self, metric, replace=False):
+        with self._lock:
+            if metric.name in self._metrics and not replace:
+                raise ValueError(f"Metrica già registrata: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, function, kind="gauge", labelnames=()):
+        # Sostituisce una callback con lo stesso nome (es. nuova connessione dopo un errore)
+        return self._register(CallbackMetric(name, documentation, kind, function, labelnames), replace=True)
+
+    def unregister(self, name):
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def expose(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.expose())
+            except Exception as e:
+                # Una callback che fallisce non deve far perdere le altre metriche
+                logger.debug(f"Metrica {metric.name} non disponibile: {e}")
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+REGISTRY = MetricsRegistry()
+
+# --- METRICHE DEL PERCORSO DI LETTURA ---
+BYTES_RECEIVED = REGISTRY.counter("ais_bytes_received_total", "Byte ricevuti dai Moxa.", ["source"])
+SENTENCES_RECEIVED = REGISTRY.counter("ais_sentences_received_total", "Sentenze NMEA ricevute.", ["source"])
+NON_NMEA_LINES = REGISTRY.counter("ais_non_nmea_lines_total", "Righe ricevute che non sono NMEA.", ["source"])
+BUFFER_OVERFLOWS = REGISTRY.counter("ais_buffer_overflows_total",
+                                    "Righe scartate dal framer perché troppo lunghe senza delimitatori.", ["source"])
+DECODED_MESSAGES = REGISTRY.counter("ais_decoded_messages_total", "Messaggi AIS decodificati.", ["msg_type"])
+DECODE_ERRORS = REGISTRY.counter("ais_decode_errors_total", "Messaggi non decodificati, per eccezione.",
+                                 ["exception"])
+STAGE_LATENCY = REGISTRY.histogram(
+    "ais_stage_latency_seconds",
+    "Durata degli stadi: framing per blocco ricevuto, assembly per sentenza, decode per messaggio, "
+    "output per batch scritto.",
+    ["stage"])
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.registry.expose()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Gli scrape periodici non devono riempire il log
+        pass
+
+
+def start_metrics_server(host=METRICS_HOST, port=METRICS_PORT, registry=REGISTRY):
+    """Avvia l'endpoint ``/metrics`` in un thread daemon. Restituisce il server, o None se disattivato o non avviabile."""
+    if not port:
+        return None
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    try:
+        server = ThreadingHTTPServer((host, port), handler)
+    except OSError as e:
+        logger.error(f"Impossibile avviare l'endpoint delle metriche su {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="ais-metrics", daemon=True).start()
+    logger.info(f"Metriche disponibili su http://{host}:{server.server_address[1]}/metrics")
+    return server
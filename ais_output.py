@@ -0,0 +1,303 @@
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import struct
+import sys
+import threading
+import time
+from array import array
+
+from ais_metrics import STAGE_LATENCY
+
+try:
+    import orjson
+except ImportError:  # orjson è opzionale: senza, si usa il modulo json della libreria standard
+    orjson = None
+
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURAZIONE DELL'OUTPUT ---
+OUTPUT_FORMAT = os.environ.get("AIS_OUTPUT_FORMAT", "ndjson")           # ndjson | binary | none
+OUTPUT_MAX_BYTES = int(os.environ.get("AIS_OUTPUT_MAX_BYTES", str(256 * 1024 * 1024)))
+OUTPUT_MAX_AGE = int(os.environ.get("AIS_OUTPUT_MAX_AGE", "3600"))       # secondi, 0 = solo per dimensione
+OUTPUT_COMPRESS = os.environ.get("AIS_OUTPUT_COMPRESS", "1") == "1"
+OUTPUT_QUEUE_SIZE = 100000
+OUTPUT_BATCH_SIZE = 1000
+OUTPUT_FLUSH_INTERVAL = 0.5
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+_STOP = object()
+
+
+def _json_default(value):
+    # I campi binari arrivano già in esadecimale dai proiettori: qui restano i record costruiti
+    # a mano (stessa codifica esadecimale) e i tipi non serializzabili
+    if isinstance(value, (bytes, bytearray)):
+        return value.hex()
+    return str(value)
+
+
+if orjson is not None:
+    def dumps_ndjson(records):
+        return b"".join(orjson.dumps(record, default=_json_default, option=orjson.OPT_APPEND_NEWLINE)
+                        for record in records)
+else:
+    _encoder = json.JSONEncoder(separators=(",", ":"), default=_json_default)
+
+    def dumps_ndjson(records):
+        return "".join(_encoder.encode(record) + "\n" for record in records).encode("utf-8")
+
+
+class NDJSONFormat:
+    extension = ".ndjson"
+
+    @staticmethod
+    def encode(records):
+        return dumps_ndjson(records)
+
+
+class BinaryColumnarFormat:
+    """Formato binario a blocchi colonnari, in sola aggiunta.
+
+    Ogni batch diventa un blocco: intestazione ``<4sBI`` (magic ``AISB``,
+    versione, numero di record N), poi le colonne numeriche little-endian
+    (timestamp f64, msg_type u8, mmsi u32, lat/lon/speed/course f64,
+    heading u16), una colonna u8 con un bit di presenza per ciascuna di
+    esse e infine, per ogni record, lunghezza u32 + JSON compatto di
+    ``raw_nmea`` e dei campi restanti. Un valore va in colonna solo se la
+    chiave c'è e il tipo è quello della colonna (float per le posizioni,
+    int negli intervalli di u8/u32/u16): gli altri casi (chiave assente,
+    None, interi al posto di float...) restano nel JSON, così ogni record
+    si rilegge identico con ``read_binary_records``.
+    """
+
+    extension = ".aisb"
+    MAGIC = b"AISB"
+    VERSION = 2
+    HEADER = struct.Struct("<4sBI")
+    # (nome, typecode, tipo Python accettato in colonna, valore massimo per gli interi)
+    RECORD_COLUMNS = (("timestamp", "d", float, None), ("msg_type", "B", int, 0xFF), ("mmsi", "I", int, 0xFFFFFFFF))
+    FIELD_COLUMNS = (("lat", "d", float, None), ("lon", "d", float, None), ("speed", "d", float, None),
+                     ("course", "d", float, None), ("heading", "H", int, 0xFFFF))
+    NUMERIC_COLUMNS = RECORD_COLUMNS + FIELD_COLUMNS
+
+    @staticmethod
+    def _columnar(value, kind, maximum):
+        # type() e non isinstance(): True non è un msg_type e un int non deve tornare float
+        if type(value) is not kind:
+            return False
+        return maximum is None or 0 <= value <= maximum
+
+    @classmethod
+    def encode(cls, records):
+        columns = [array(typecode) for _, typecode, _, _ in cls.NUMERIC_COLUMNS]
+        presence = array("B")
+        extras = []
+        record_columns = len(cls.RECORD_COLUMNS)
+        for record in records:
+            extra = dict(record)
+            fields = record.get("decoded_fields")
+            if isinstance(fields, dict):
+                fields = extra["decoded_fields"] = dict(fields)
+            bits = 0
+            for index, (name, _, kind, maximum) in enumerate(cls.NUMERIC_COLUMNS):
+                source = extra if index < record_columns else fields
+                if isinstance(source, dict) and name in source and cls._columnar(source[name], kind, maximum):
+                    columns[index].append(source.pop(name))
+                    bits |= 1 << index
+                else:
+                    columns[index].append(0)
+            presence.append(bits)
+            extras.append(dumps_ndjson((extra,))[:-1])
+
+        lengths = array("I", (len(extra) for extra in extras))
+        columns += [presence, lengths]
+        if sys.byteorder != "little":
+            for column in columns:
+                column.byteswap()
+        parts = [cls.HEADER.pack(cls.MAGIC, cls.VERSION, len(presence))]
+        parts.extend(column.tobytes() for column in columns)
+        parts.extend(extras)
+        return b"".join(parts)
+
+
+def read_binary_records(path):
+    """Rilegge un file ``.aisb`` (anche compresso ``.gz``) restituendo i record come dict."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as stream:
+        data = stream.read()
+    header = BinaryColumnarFormat.HEADER
+    layout = [(name, typecode) for name, typecode, _, _ in BinaryColumnarFormat.NUMERIC_COLUMNS]
+    layout += [("_presence", "B"), ("_length", "I")]
+    record_columns = len(BinaryColumnarFormat.RECORD_COLUMNS)
+    offset = 0
+    while offset < len(data):
+        magic, version, count = header.unpack_from(data, offset)
+        if magic != BinaryColumnarFormat.MAGIC or version != BinaryColumnarFormat.VERSION:
+            raise ValueError(f"Blocco non valido in {path} all'offset {offset}")
+        offset += header.size
+        columns = []
+        for name, typecode in layout:
+            column = array(typecode)
+            size = column.itemsize * count
+            column.frombytes(data[offset:offset + size])
+            if sys.byteorder != "little":
+                column.byteswap()
+            columns.append(column)
+            offset += size
+        presence, lengths = columns[-2], columns[-1]
+        for i in range(count):
+            length = lengths[i]
+            extra = json.loads(data[offset:offset + length])
+            offset += length
+            bits = presence[i]
+            record = {name: columns[index][i] for index, (name, _) in enumerate(layout[:record_columns])
+                      if bits & (1 << index)}
+            record.update(extra)
+            fields = record.get("decoded_fields")
+            for index in range(record_columns, len(layout) - 2):
+                if bits & (1 << index):
+                    fields[layout[index][0]] = columns[index][i]
+            yield record
+
+
+OUTPUT_FORMATS = {"ndjson": NDJSONFormat, "binary": BinaryColumnarFormat}
+
+
+class AISOutputWriter:
+    """Scrive i messaggi decodificati su file da un thread dedicato.
+
+    ``write()`` mette solo il record in una coda limitata (se è piena il
+    record viene scartato e contato in ``dropped``, il lettore non si ferma
+    mai). Il thread di scrittura serializza i record a batch e li scrive
+    con una sola chiamata; il file viene ruotato per dimensione o età e i
+    file ruotati vengono compressi con gzip in background.
+    """
+
+    def __init__(self, directory, basename="ais_decoded", output_format=OUTPUT_FORMAT,
+                 max_bytes=OUTPUT_MAX_BYTES, max_age=OUTPUT_MAX_AGE, compress=OUTPUT_COMPRESS,
+                 queue_size=OUTPUT_QUEUE_SIZE, batch_size=OUTPUT_BATCH_SIZE, flush_interval=OUTPUT_FLUSH_INTERVAL):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Formato di output sconosciuto: {output_format} (validi: {', '.join(OUTPUT_FORMATS)})")
+        self.format = OUTPUT_FORMATS[output_format]
+        self.directory = directory
+        self.path = os.path.join(directory, basename + self.format.extension)
+        self.basename = basename
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compress = compress
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._file = None
+        self._opened_at = 0.0
+        self._size = 0
+        self._compressors = []
+        self._latency = STAGE_LATENCY.labels("output")
+
+        # Statistiche
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.rotations = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="ais-output", daemon=True)
+        self._thread.start()
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def write(self, record):
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout=30):
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        for compressor in self._compressors:
+            compressor.join(timeout)
+
+    def _open(self):
+        self._file = open(self.path, "ab", buffering=WRITE_BUFFER_SIZE)
+        self._size = self._file.tell()
+        self._opened_at = time.time()
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        rotated = os.path.join(self.directory, f"{self.basename}-{stamp}{self.format.extension}")
+        suffix = 1
+        while os.path.exists(rotated) or os.path.exists(rotated + ".gz"):
+            rotated = os.path.join(self.directory, f"{self.basename}-{stamp}-{suffix}{self.format.extension}")
+            suffix += 1
+        os.replace(self.path, rotated)
+        self.rotations += 1
+        if self.compress:
+            # La compressione non deve rallentare la scrittura dei batch successivi
+            self._compressors = [thread for thread in self._compressors if thread.is_alive()]
+            compressor = threading.Thread(target=_gzip_file, args=(rotated,), name="ais-output-gzip", daemon=True)
+            compressor.start()
+            self._compressors.append(compressor)
+
+    def _write_batch(self, batch):
+        started = time.perf_counter()
+        if self._file is None:
+            self._open()
+        data = self.format.encode(batch)
+        self._file.write(data)
+        self._latency.observe(time.perf_counter() - started)
+        self._size += len(data)
+        self.written += len(batch)
+        self.batches += 1
+        if self._size >= self.max_bytes or (self.max_age and time.time() - self._opened_at >= self.max_age):
+            self._rotate()
+
+    def _run(self):
+        batch = []
+        while True:
+            try:
+                record = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                record = None
+            if record is not None and record is not _STOP:
+                batch.append(record)
+                # Svuota quello che è già in coda senza attese
+                while len(batch) < self.batch_size:
+                    try:
+                        record = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if record is _STOP:
+                        break
+                    batch.append(record)
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    logger.error(f"ERRORE durante la scrittura di {len(batch)} record su {self.path}: {e}", exc_info=True)
+                batch = []
+            if record is _STOP:
+                break
+            if self._file is not None:
+                self._file.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def _gzip_file(path):
+    try:
+        with open(path, "rb") as source, gzip.open(path + ".gz", "wb", compresslevel=6) as target:
+            shutil.copyfileobj(source, target, WRITE_BUFFER_SIZE)
+        os.remove(path)
+    except OSError as e:
+        logger.error(f"ERRORE durante la compressione di {path}: {e}")
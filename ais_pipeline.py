@@ -0,0 +1,172 @@
+import collections
+import multiprocessing
+import os
+import queue
+import time
+from bisect import bisect_left
+
+from ais_decoding import decode_log_data, payload_bits
+from ais_metrics import STAGE_LATENCY
+
+
+# --- CONFIGURAZIONE DELLA PIPELINE DI DECODIFICA ---
+# 0 worker = decodifica in linea sul thread del lettore (comportamento storico)
+DECODE_WORKERS = int(os.environ.get("AIS_DECODE_WORKERS", "0"))
+DECODE_BATCH_SIZE = int(os.environ.get("AIS_DECODE_BATCH_SIZE", "256"))
+FLUSH_INTERVAL = 0.05       # secondi massimi di attesa di un batch incompleto
+
+# Esito negativo della decodifica, restituito al lettore insieme ai messaggi decodificati
+DecodeError = collections.namedtuple("DecodeError", ["source_id", "raw_nmea", "exception", "message"])
+
+
+def mmsi_from_message(assembled_message):
+    """Estrae l'MMSI dai primi caratteri del payload, senza decodificare il messaggio.
+
+    Serve solo per scegliere lo shard: se il payload non è leggibile restituisce 0.
+    """
+    first = assembled_message[0] if isinstance(assembled_message, (list, tuple)) else assembled_message
+    try:
+        payload = first.split(",", 6)[5]
+    except IndexError:
+        return 0
+    # 38 bit letti: tipo (6) + repeat (2) + MMSI (30)
+    bits = payload_bits(payload, 38)
+    return bits & 0x3FFFFFFF if bits is not None else 0
+
+
+def decode_batch(batch, latency=None):
+    # Eseguita nei processi worker: decodifica un batch e restituisce i risultati nello stesso ordine.
+    # Con ``latency`` (conteggi per bucket di STAGE_LATENCY + somma, vedi merge()) cronometra ogni messaggio
+    results = []
+    buckets = STAGE_LATENCY.buckets
+    for source_id, received_at, assembled_message in batch:
+        started = time.perf_counter()
+        try:
+            log_data = decode_log_data(assembled_message, received_at)
+            if log_data is None:
+                results.append(DecodeError(source_id, assembled_message, "EmptyDecode", ""))
+            else:
+                if source_id is not None:
+                    log_data["source_id"] = source_id
+                results.append(log_data)
+        except Exception as e:
+            results.append(DecodeError(source_id, assembled_message, type(e).__name__, str(e)))
+        if latency is not None:
+            elapsed = time.perf_counter() - started
+            latency[bisect_left(buckets, elapsed)] += 1
+            latency[-1] += elapsed
+    return results
+
+
+def _decode_worker(input_queue, output_queue):
+    while True:
+        batch = input_queue.get()
+        if batch is None:
+            output_queue.put(None)
+            return
+        latency = [0] * (len(STAGE_LATENCY.buckets) + 2)
+        results = decode_batch(batch, latency)
+        # Le durate per messaggio tornano al lettore già raggruppate: le metriche vivono nel suo processo
+        output_queue.put((latency, results))
+
+
+class DecodePipeline:
+    """Distribuisce la decodifica pyais su un pool di processi.
+
+    Il lettore continua a fare framing e assemblaggio multi-part e passa i
+    messaggi completi a ``submit()``. I messaggi vengono raggruppati in
+    batch per shard (MMSI modulo numero di worker): ogni worker ha la sua
+    coda FIFO, quindi i messaggi di una stessa nave escono nell'ordine in
+    cui sono entrati. I risultati tornano a batch tramite ``poll()``.
+    Senza ``received_at`` il timestamp del record è quello di fine
+    decodifica nel worker, come nella decodifica in linea.
+    """
+
+    def __init__(self, workers=DECODE_WORKERS or os.cpu_count(), batch_size=DECODE_BATCH_SIZE,
+                 flush_interval=FLUSH_INTERVAL, max_pending_batches=64):
+        if workers < 1:
+            raise ValueError(f"Numero di worker non valido: {workers}")
+        self.workers = workers
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._output = multiprocessing.Queue()
+        self._inputs = []
+        self._processes = []
+        for shard in range(workers):
+            # Coda di ingresso limitata: se i worker non tengono il passo, submit() rallenta il lettore
+            input_queue = multiprocessing.Queue(maxsize=max_pending_batches)
+            process = multiprocessing.Process(target=_decode_worker, args=(input_queue, self._output),
+                                              name=f"ais-decode-{shard}", daemon=True)
+            process.start()
+            self._inputs.append(input_queue)
+            self._processes.append(process)
+        self._batches = [[] for _ in range(workers)]
+        self._batch_started = [0.0] * workers
+        self._running_workers = workers
+        self._decode_latency = STAGE_LATENCY.labels("decode")
+
+        # Statistiche
+        self.submitted = 0
+        self.completed = 0
+        self.batches_sent = 0
+
+    @property
+    def in_flight(self):
+        return self.submitted - self.completed
+
+    def submit(self, assembled_message, received_at=None, source_id=None):
+        shard = mmsi_from_message(assembled_message) % self.workers
+        batch = self._batches[shard]
+        if not batch:
+            self._batch_started[shard] = time.monotonic()
+        batch.append((source_id, received_at, assembled_message))
+        self.submitted += 1
+        if len(batch) >= self.batch_size:
+            self._send(shard)
+
+    def _send(self, shard):
+        batch = self._batches[shard]
+        if batch:
+            self._batches[shard] = []
+            self._inputs[shard].put(batch)
+            self.batches_sent += 1
+
+    def flush(self, stale_only=False):
+        # Invia i batch incompleti (solo quelli più vecchi di flush_interval se stale_only)
+        now = time.monotonic()
+        for shard, batch in enumerate(self._batches):
+            if batch and (not stale_only or now - self._batch_started[shard] >= self.flush_interval):
+                self._send(shard)
+
+    def poll(self, timeout=0):
+        """Restituisce i risultati pronti come lista di batch (dict decodificati o ``DecodeError``)."""
+        batches = []
+        try:
+            batch = self._output.get(timeout=timeout) if timeout else self._output.get_nowait()
+            while True:
+                if batch is None:
+                    self._running_workers -= 1
+                else:
+                    latency, batch = batch
+                    self.completed += len(batch)
+                    batches.append(batch)
+                    self._decode_latency.merge(latency)
+                batch = self._output.get_nowait()
+        except queue.Empty:
+            pass
+        return batches
+
+    def close(self, timeout=10):
+        """Invia i batch residui, attende i worker e restituisce gli ultimi risultati."""
+        self.flush()
+        for input_queue in self._inputs:
+            input_queue.put(None)
+        batches = []
+        deadline = time.monotonic() + timeout
+        while self._running_workers and time.monotonic() < deadline:
+            batches.extend(self.poll(timeout=0.1))
+        for process in self._processes:
+            process.join(timeout=max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                process.terminate()
+        return batches
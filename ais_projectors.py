@@ -0,0 +1,196 @@
+import os
+
+
+# --- SCHEMA DEI CAMPI DECODIFICATI ---
+# Per ogni tipo AIS (1-27) i campi di "decoded_fields", con i nomi degli attributi
+# di pyais. Uno schema per tipo, uguale per tutte le varianti della classe pyais:
+# i campi che una variante non ha (es. tipo 24 parte A senza callsign) valgono None.
+# Restano fuori msg_type/mmsi (sono nel record), repeat e i bit spare/reserved.
+# "dimensions" raggruppa to_bow/to_stern/to_port/to_starboard in un dict annidato.
+# I campi binari (es. "data" dei tipi 6/8/17/25/26) diventano stringhe esadecimali,
+# così ogni record è serializzabile in JSON così com'è.
+# APPLICATION_FIELDS (tipi 6 e 8) aggiunge i campi dell'applicazione DAC/FID
+# riconosciuta da pyais, diversi per ogni variante.
+DIMENSIONS = "dimensions"
+DIMENSION_FIELDS = ("to_bow", "to_stern", "to_port", "to_starboard")
+APPLICATION_FIELDS = "*"
+
+_POSITION_A = ("status", "turn", "speed", "accuracy", "lon", "lat", "course", "heading", "second",
+               "maneuver", "raim", "radio")
+_BASE_STATION = ("year", "month", "day", "hour", "minute", "second", "accuracy", "lon", "lat", "epfd",
+                 "raim", "radio")
+_SAFETY_ACK = ("mmsi1", "mmsiseq1", "mmsi2", "mmsiseq2", "mmsi3", "mmsiseq3", "mmsi4", "mmsiseq4")
+
+FIELD_TABLE = {
+    1: _POSITION_A,
+    2: _POSITION_A,
+    3: _POSITION_A,
+    4: _BASE_STATION,
+    5: ("ais_version", "imo", "callsign", "shipname", "ship_type", DIMENSIONS, "epfd", "month", "day",
+        "hour", "minute", "draught", "destination", "dte"),
+    6: ("seqno", "dest_mmsi", "retransmit", "dac", "fid", "data", APPLICATION_FIELDS),
+    7: _SAFETY_ACK,
+    8: ("dac", "fid", "data", APPLICATION_FIELDS),
+    9: ("alt", "speed", "accuracy", "lon", "lat", "course", "second", "dte", "assigned", "raim", "radio"),
+    10: ("dest_mmsi",),
+    11: _BASE_STATION,
+    12: ("seqno", "dest_mmsi", "retransmit", "text"),
+    13: _SAFETY_ACK,
+    14: ("text",),
+    15: ("mmsi1", "type1_1", "offset1_1", "type1_2", "offset1_2", "mmsi2", "type2_1", "offset2_1"),
+    16: ("mmsi1", "offset1", "increment1", "mmsi2", "offset2", "increment2"),
+    17: ("lon", "lat", "data"),
+    18: ("speed", "accuracy", "lon", "lat", "course", "heading", "second", "cs", "display", "dsc", "band",
+         "msg22", "assigned", "raim", "radio"),
+    19: ("speed", "accuracy", "lon", "lat", "course", "heading", "second", "shipname", "ship_type",
+         DIMENSIONS, "epfd", "raim", "dte", "assigned"),
+    20: tuple(f"{name}{slot}" for slot in range(1, 5) for name in ("offset", "number", "timeout", "increment")),
+    21: ("aid_type", "name", "name_ext", "accuracy", "lon", "lat", DIMENSIONS, "epfd", "second",
+         "off_position", "raim", "virtual_aid", "assigned"),
+    22: ("channel_a", "channel_b", "txrx", "power", "addressed", "dest1", "dest2", "ne_lon", "ne_lat",
+         "sw_lon", "sw_lat", "band_a", "band_b", "zonesize"),
+    23: ("ne_lon", "ne_lat", "sw_lon", "sw_lat", "station_type", "ship_type", "txrx", "interval", "quiet"),
+    24: ("partno", "shipname", "ship_type", "vendorid", "model", "serial", "callsign", DIMENSIONS,
+         "mothership_mmsi"),
+    25: ("addressed", "structured", "dest_mmsi", "app_id", "data"),
+    26: ("addressed", "structured", "dest_mmsi", "app_id", "data", "radio"),
+    27: ("accuracy", "raim", "status", "lon", "lat", "speed", "course", "gnss"),
+}
+
+# Selezione dei campi (es. AIS_FIELDS=lat,lon,speed,course,heading,shipname,dimensions).
+# Predefinita (AIS_FIELDS vuota o *): lo schema intero di FIELD_TABLE per tutti i tipi.
+# AIS_FIELDS=compact seleziona COMPACT_FIELDS, i campi usati da VesselRegistry e dal bridge.
+# I tipi senza nessun campo selezionato non vengono decodificati da pyais
+# (vedi FieldProjectors.skipped_types).
+COMPACT_FIELDS = ("status", "lat", "lon", "speed", "course", "heading", "shipname", "ship_type", "callsign",
+                  "imo", DIMENSIONS, "partno")
+ALL_FIELDS = "*"
+_FIELD_PRESETS = {"compact": COMPACT_FIELDS}
+
+
+def _field_selection(value):
+    value = value.strip()
+    if value in _FIELD_PRESETS:
+        return _FIELD_PRESETS[value]
+    if value == ALL_FIELDS:
+        return ()
+    return tuple(name.strip() for name in value.split(",") if name.strip())
+
+
+FIELD_SELECTION = _field_selection(os.environ.get("AIS_FIELDS", ""))
+
+_ENVELOPE_FIELDS = ("msg_type", "repeat", "mmsi")
+
+
+def _payload_fields(cls):
+    # Attributi informativi di una classe pyais, nell'ordine del messaggio
+    return tuple(field.name for field in cls.fields()
+                 if field.name not in _ENVELOPE_FIELDS and not field.name.startswith(("spare", "reserved")))
+
+
+def _binary_fields(cls):
+    # Attributi che pyais decodifica come bytes
+    return frozenset(field.name for field in cls.fields() if field.metadata.get("d_type") is bytes)
+
+
+def _variant_classes(msg_type):
+    # Classi pyais concrete di un tipo: per 6 e 8 una per ogni applicazione DAC/FID riconosciuta
+    from pyais import messages
+    classes = []
+    for cls in vars(messages).values():
+        if not (isinstance(cls, type) and issubclass(cls, messages.Payload)) or cls is messages.Payload:
+            continue
+        try:
+            fields = cls.fields()
+        except IndexError:
+            # Classi che smistano verso le varianti (es. MessageType6): non hanno campi propri
+            continue
+        if fields and fields[0].name == "msg_type" and fields[0].metadata.get("default") == msg_type:
+            classes.append(cls)
+    return classes
+
+
+def _hex(value):
+    return value.hex() if isinstance(value, (bytes, bytearray)) else value
+
+
+def _build_projector(schema, available, binary=frozenset()):
+    """Compila il proiettore di una classe pyais in una funzione che costruisce il dict con un letterale.
+
+    ``schema`` sono le chiavi di "decoded_fields" (con ``dimensions``),
+    ``available`` gli attributi della classe, ``binary`` quelli in bytes
+    (convertiti in esadecimale). Il dict risultante ha sempre tutte le
+    chiavi dello schema, None per quelle assenti nella classe.
+    Come per namedtuple, il codice viene generato una volta sola: un
+    letterale con accessi diretti agli attributi costa circa la metà di
+    ``dict(zip(keys, attrgetter(...)(message)))``.
+    """
+    items = []
+    for name in schema:
+        if not name.isidentifier():
+            raise ValueError(f"Nome di campo non valido: {name!r}")
+        if name == DIMENSIONS:
+            if all(field in available for field in DIMENSION_FIELDS):
+                value = "{" + ", ".join(f"{field!r}: message.{field}" for field in DIMENSION_FIELDS) + "}"
+            else:
+                value = "None"
+        elif name in binary:
+            value = f"_hex(message.{name})"
+        else:
+            value = f"message.{name}" if name in available else "None"
+        items.append(f"{name!r}: {value}")
+    return eval("lambda message: {" + ", ".join(items) + "}", {"_hex": _hex})
+
+
+class FieldProjectors:
+    """Estrazione dei campi decodificati guidata da ``FIELD_TABLE``.
+
+    I proiettori sono compilati alla prima occorrenza di ogni classe pyais
+    (i tipi mai ricevuti non costano nulla) e poi riusati: un messaggio
+    costa una ricerca nel dict e una chiamata al proiettore. ``fields``
+    limita l'estrazione ai campi indicati (vuoto = schema intero); i tipi
+    fuori tabella (es. 28) usano tutti gli attributi informativi della loro
+    classe. ``skipped_types`` sono i tipi che con questa selezione non
+    avrebbero nessun campo: non serve decodificarli. Per 6 e 8 si
+    guardano anche i campi di tutte le applicazioni DAC/FID di pyais.
+    """
+
+    def __init__(self, fields=FIELD_SELECTION):
+        self.fields = frozenset(fields) if fields else None
+        self._projectors = {}
+        self.skipped_types = frozenset()
+        if self.fields is not None:
+            self.skipped_types = frozenset(msg_type for msg_type in FIELD_TABLE if not self._selects_any(msg_type))
+
+    def _selects_any(self, msg_type):
+        if self.schema(msg_type):
+            return True
+        if APPLICATION_FIELDS not in FIELD_TABLE[msg_type]:
+            return False
+        return any(self.schema(msg_type, cls) for cls in _variant_classes(msg_type))
+
+    def schema(self, msg_type, cls=None):
+        """Chiavi di "decoded_fields" per un tipo (per i tipi 6/8/fuori tabella serve la classe pyais)."""
+        table = FIELD_TABLE.get(msg_type)
+        if table is None:
+            table = (APPLICATION_FIELDS,)
+        schema = [name for name in table if name != APPLICATION_FIELDS]
+        if APPLICATION_FIELDS in table and cls is not None:
+            known = set(schema).union(DIMENSION_FIELDS)
+            schema.extend(name for name in _payload_fields(cls) if name not in known)
+        if self.fields is not None:
+            schema = [name for name in schema if name in self.fields]
+        return tuple(schema)
+
+    def project(self, message):
+        try:
+            projector = self._projectors[message.__class__]
+        except KeyError:
+            cls = message.__class__
+            projector = self._projectors[cls] = _build_projector(self.schema(message.msg_type, cls),
+                                                                  frozenset(_payload_fields(cls)),
+                                                                  _binary_fields(cls))
+        return projector(message)
+
+
+DEFAULT_PROJECTORS = FieldProjectors()
@@ -0,0 +1,348 @@
+import asyncio
+import collections
+import json
+import logging
+import math
+import os
+import time
+
+from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
+
+from ais_dedup import MessageFilter, register_filter_metrics
+from ais_ingest import AISIngestEngine, decode_from_engine, load_endpoints, register_engine_metrics
+from ais_metrics import start_metrics_server
+from vessel_registry import VesselRegistry
+
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURAZIONE DEL BRIDGE ---
+BRIDGE_HOST = os.environ.get("BRIDGE_HOST", "0.0.0.0")
+BRIDGE_PORT = int(os.environ.get("BRIDGE_PORT", "8765"))
+CLIENT_QUEUE_SIZE = 1000    # frame in attesa per client; oltre si scartano i più vecchi
+GRID_CELL_DEGREES = 1.0     # lato delle celle dell'indice spaziale delle sottoscrizioni
+MAX_BBOX_CELLS = 4096       # bbox più grandi non vengono indicizzate per cella ma verificate a parte
+STATS_INTERVAL = 30
+
+
+def _grid_cell(lat, lon, cell_size):
+    return int((lat + 90.0) // cell_size), int((lon + 180.0) // cell_size)
+
+
+def _finite(value, name):
+    # json.loads accetta NaN, Infinity e 1e400 (-> inf): nell'indice darebbero ValueError/OverflowError
+    if isinstance(value, float) and not math.isfinite(value):
+        raise ValueError(f"Valore non valido in {name}: {value}")
+    return value
+
+
+def _valid_position(lat, lon):
+    # pyais restituisce 91/181 quando la posizione non è disponibile
+    return (isinstance(lat, (int, float)) and isinstance(lon, (int, float))
+            and -90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0)
+
+
+class SubscriptionFilter:
+    """Filtro di un client: tipi di messaggio, insieme di MMSI e bounding box.
+
+    Ogni criterio è opzionale (``None`` = nessun vincolo). Il client lo
+    invia come JSON, per esempio::
+
+        {"msg_types": [1, 2, 3, 18], "mmsi": [247123456], "bbox": [8.5, 43.0, 11.0, 44.5]}
+
+    ``bbox`` segue l'ordine GeoJSON: ``[lon_min, lat_min, lon_max, lat_max]``.
+    """
+
+    __slots__ = ("msg_types", "mmsi", "bbox")
+
+    def __init__(self, msg_types=None, mmsi=None, bbox=None):
+        self.msg_types = frozenset(int(_finite(t, "msg_types")) for t in msg_types) if msg_types else None
+        self.mmsi = frozenset(int(_finite(m, "mmsi")) for m in mmsi) if mmsi else None
+        if bbox:
+            lon_min, lat_min, lon_max, lat_max = (_finite(float(v), "bbox") for v in bbox)
+            if lon_min > lon_max or lat_min > lat_max:
+                raise ValueError(f"bbox non valida: {bbox}")
+            self.bbox = (lon_min, lat_min, lon_max, lat_max)
+        else:
+            self.bbox = None
+
+    @classmethod
+    def from_request(cls, request):
+        if not isinstance(request, dict):
+            raise ValueError("La sottoscrizione deve essere un oggetto JSON.")
+        unknown = set(request) - {"msg_types", "mmsi", "bbox"}
+        if unknown:
+            raise ValueError(f"Campi di sottoscrizione sconosciuti: {sorted(unknown)}")
+        return cls(request.get("msg_types"), request.get("mmsi"), request.get("bbox"))
+
+    def to_dict(self):
+        return {
+            "msg_types": sorted(self.msg_types) if self.msg_types else None,
+            "mmsi": sorted(self.mmsi) if self.mmsi else None,
+            "bbox": list(self.bbox) if self.bbox else None,
+        }
+
+    def matches(self, msg_type, mmsi, lat, lon):
+        if self.msg_types is not None and msg_type not in self.msg_types:
+            return False
+        if self.mmsi is not None and mmsi not in self.mmsi:
+            return False
+        if self.bbox is not None:
+            if lat is None:
+                return False
+            lon_min, lat_min, lon_max, lat_max = self.bbox
+            if not (lon_min <= lon <= lon_max and lat_min <= lat <= lat_max):
+                return False
+        return True
+
+
+class Subscriber:
+    # Un client WebSocket con la sua coda di invio limitata (drop-oldest)
+
+    def __init__(self, websocket, queue_size=CLIENT_QUEUE_SIZE):
+        self.websocket = websocket
+        self.filter = SubscriptionFilter()
+        self.queue = collections.deque(maxlen=queue_size)
+        self.wakeup = asyncio.Event()
+        self.sent = 0
+        self.dropped = 0
+
+    def enqueue(self, frame):
+        queue = self.queue
+        if len(queue) == queue.maxlen:
+            # deque con maxlen scarta da sola il frame più vecchio: lo contiamo soltanto
+            self.dropped += 1
+        queue.append(frame)
+        if not self.wakeup.is_set():
+            self.wakeup.set()
+
+
+class SubscriptionIndex:
+    """Indice inverso delle sottoscrizioni.
+
+    Ogni client è indicizzato sul suo criterio più selettivo (MMSI, poi
+    celle della bbox, poi tipo di messaggio); per un messaggio si leggono
+    solo i bucket corrispondenti e si verificano i criteri restanti sui
+    pochi candidati, invece di valutare il filtro di tutti i client.
+    """
+
+    def __init__(self, cell_size=GRID_CELL_DEGREES, max_bbox_cells=MAX_BBOX_CELLS):
+        self.cell_size = cell_size
+        self.max_bbox_cells = max_bbox_cells
+        self._everyone = set()      # nessun filtro: ricevono tutto senza verifiche
+        self._unindexed = set()     # filtri non indicizzabili (bbox enorme senza altri criteri)
+        self._by_mmsi = collections.defaultdict(set)
+        self._by_cell = collections.defaultdict(set)
+        self._by_type = collections.defaultdict(set)
+        self._entries = {}          # subscriber -> (indice, chiavi) per la rimozione
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _bbox_cells(self, bbox):
+        lon_min, lat_min, lon_max, lat_max = bbox
+        row_min, col_min = _grid_cell(lat_min, lon_min, self.cell_size)
+        row_max, col_max = _grid_cell(lat_max, lon_max, self.cell_size)
+        if (row_max - row_min + 1) * (col_max - col_min + 1) > self.max_bbox_cells:
+            return None
+        return [(row, col) for row in range(row_min, row_max + 1) for col in range(col_min, col_max + 1)]
+
+    def add(self, subscriber):
+        self.remove(subscriber)
+        subscription = subscriber.filter
+        if subscription.mmsi is not None:
+            index, keys = self._by_mmsi, subscription.mmsi
+        elif subscription.bbox is not None and (cells := self._bbox_cells(subscription.bbox)) is not None:
+            index, keys = self._by_cell, cells
+        elif subscription.msg_types is not None:
+            index, keys = self._by_type, subscription.msg_types
+        elif subscription.bbox is not None:
+            self._unindexed.add(subscriber)
+            self._entries[subscriber] = (None, self._unindexed)
+            return
+        else:
+            self._everyone.add(subscriber)
+            self._entries[subscriber] = (None, self._everyone)
+            return
+        for key in keys:
+            index[key].add(subscriber)
+        self._entries[subscriber] = (index, keys)
+
+    def remove(self, subscriber):
+        entry = self._entries.pop(subscriber, None)
+        if entry is None:
+            return
+        index, keys = entry
+        if index is None:
+            keys.discard(subscriber)
+            return
+        for key in keys:
+            bucket = index.get(key)
+            if bucket is not None:
+                bucket.discard(subscriber)
+                if not bucket:
+                    del index[key]
+
+    def match(self, msg_type, mmsi, lat, lon):
+        matched = list(self._everyone)
+        candidates = []
+        bucket = self._by_mmsi.get(mmsi)
+        if bucket:
+            candidates.extend(bucket)
+        if lat is not None and self._by_cell:
+            bucket = self._by_cell.get(_grid_cell(lat, lon, self.cell_size))
+            if bucket:
+                candidates.extend(bucket)
+        bucket = self._by_type.get(msg_type)
+        if bucket:
+            candidates.extend(bucket)
+        candidates.extend(self._unindexed)
+        # Un client sta in un solo bucket per messaggio, quindi non servono deduplicazioni
+        for subscriber in candidates:
+            if subscriber.filter.matches(msg_type, mmsi, lat, lon):
+                matched.append(subscriber)
+        return matched
+
+
+class AISWebSocketBridge:
+    """Distribuisce i messaggi AIS decodificati a molti client WebSocket.
+
+    Ogni messaggio viene serializzato e codificato una sola volta; lo
+    stesso frame ``bytes`` viene accodato a tutti i client interessati.
+    """
+
+    def __init__(self, client_queue_size=CLIENT_QUEUE_SIZE, cell_size=GRID_CELL_DEGREES):
+        self.client_queue_size = client_queue_size
+        self.index = SubscriptionIndex(cell_size)
+        self._subscribers = set()
+        # Ultima posizione nota per MMSI: i messaggi statici (es. tipo 5) seguono il filtro bbox della nave
+        self.vessels = VesselRegistry()
+        self.published = 0
+        self.frames_enqueued = 0
+        self.frames_dropped = 0
+        self.frames_sent = 0
+
+    def stats(self):
+        return {
+            "subscribers": len(self.index),
+            "vessels": len(self.vessels),
+            "published": self.published,
+            "frames_enqueued": self.frames_enqueued,
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped + sum(s.dropped for s in self._subscribers),
+        }
+
+    def publish(self, log_data):
+        # Va chiamato dal thread dell'event loop
+        msg_type = log_data.get("msg_type")
+        mmsi = log_data.get("mmsi")
+        fields = log_data.get("decoded_fields") or {}
+        lat, lon = fields.get("lat"), fields.get("lon")
+        self.vessels.apply(log_data)
+        if not _valid_position(lat, lon):
+            lat, lon = self.vessels.position(mmsi) or (None, None)
+
+        self.published += 1
+        subscribers = self.index.match(msg_type, mmsi, lat, lon)
+        if not subscribers:
+            return 0
+        frame = json.dumps(log_data, separators=(",", ":"), default=str).encode("utf-8")
+        for subscriber in subscribers:
+            subscriber.enqueue(frame)
+        self.frames_enqueued += len(subscribers)
+        return len(subscribers)
+
+    async def _sender(self, subscriber):
+        websocket = subscriber.websocket
+        queue = subscriber.queue
+        try:
+            while True:
+                await subscriber.wakeup.wait()
+                subscriber.wakeup.clear()
+                while queue:
+                    # text=True: il frame è già UTF-8, websockets non lo ricodifica per ogni client
+                    await websocket.send(queue.popleft(), text=True)
+                    subscriber.sent += 1
+                    self.frames_sent += 1
+        except ConnectionClosed:
+            # Client disconnesso durante l'invio: la pulizia la fa handler()
+            pass
+
+    async def handler(self, websocket):
+        subscriber = Subscriber(websocket, self.client_queue_size)
+        self._subscribers.add(subscriber)
+        self.index.add(subscriber)
+        sender = asyncio.create_task(self._sender(subscriber))
+        logger.info(f"Client connesso: {websocket.remote_address} ({len(self.index)} totali)")
+        try:
+            async for request in websocket:
+                try:
+                    subscriber.filter = SubscriptionFilter.from_request(json.loads(request))
+                except (ValueError, TypeError) as e:
+                    await websocket.send(json.dumps({"error": str(e)}))
+                    continue
+                self.index.add(subscriber)
+                await websocket.send(json.dumps({"subscribed": subscriber.filter.to_dict()}))
+        except ConnectionClosed:
+            pass
+        finally:
+            self.index.remove(subscriber)
+            self._subscribers.discard(subscriber)
+            sender.cancel()
+            # Attende il sender: un suo errore non resta come "Task exception was never retrieved"
+            await asyncio.gather(sender, return_exceptions=True)
+            self.frames_dropped += subscriber.dropped
+            logger.info(f"Client disconnesso: {websocket.remote_address} "
+                        f"(inviati={subscriber.sent}, scartati={subscriber.dropped})")
+
+    def serve(self, host=BRIDGE_HOST, port=BRIDGE_PORT):
+        # Compressione disattivata: con permessage-deflate ogni frame verrebbe compresso per ogni client
+        return serve(self.handler, host, port, compression=None)
+
+
+async def feed_bridge_from_engine(bridge, engine, message_filter):
+    await decode_from_engine(engine, message_filter, bridge.publish)
+
+
+async def _log_stats(bridge, message_filter, interval):
+    while True:
+        await asyncio.sleep(interval)
+        bridge.vessels.expire()
+        message_filter.expire(time.time())
+        logger.info(f"Bridge: {bridge.stats()}")
+        logger.info(f"Filtro messaggi: {message_filter.stats()}")
+
+
+async def run_bridge(endpoints, host=BRIDGE_HOST, port=BRIDGE_PORT):
+    bridge = AISWebSocketBridge()
+    engine = AISIngestEngine(endpoints)
+    message_filter = MessageFilter(sources=len(engine.endpoints))
+    register_engine_metrics(engine)
+    register_filter_metrics(message_filter)
+    async with bridge.serve(host, port):
+        logger.info(f"Bridge WebSocket in ascolto su ws://{host}:{port}")
+        engine.start()
+        stats_task = asyncio.create_task(_log_stats(bridge, message_filter, STATS_INTERVAL))
+        try:
+            await feed_bridge_from_engine(bridge, engine, message_filter)
+        finally:
+            stats_task.cancel()
+            await engine.stop()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    endpoints = load_endpoints()
+    if not endpoints:
+        logger.critical("Nessun Moxa configurato. Impostare MOXA_CONFIG, MOXA_ENDPOINTS oppure MOXA_IP e MOXA_PORT.")
+        return
+    start_metrics_server()
+    try:
+        asyncio.run(run_bridge(endpoints))
+    except KeyboardInterrupt:
+        logger.info("Interrotto dall'utente.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import argparse
+import random
+import time
+
+from pyais.encode import encode_dict
+
+from ais_decoding import decode_assembled
+from ais_dedup import MessageFilter
+
+
+# Benchmark del filtro prima della decodifica: ricevitori sovrapposti e classe A che trasmettono spesso.
+# Uso: python bench_dedup.py --vessels 500 --duration 600 --receivers 3 --thin-interval 30 --thin-distance 100
+# Ogni nave trasmette una posizione ogni 2-10 s spostandosi lentamente; ogni ricevitore
+# la riceve con probabilità --coverage e un ritardo casuale fino a 1 s.
+
+
+def simulate(vessels, duration, receivers, coverage, seed=42):
+    rng = random.Random(seed)
+    arrivals = []
+    for index in range(vessels):
+        mmsi = 247000000 + index
+        lat, lon = rng.uniform(40.0, 45.0), rng.uniform(8.0, 14.0)
+        period = rng.choice((2, 3.3, 6, 10))
+        speed = rng.choice((0.0, 0.0, 5.0, 12.0))       # nodi: metà della flotta ferma
+        t = rng.uniform(0, period)
+        while t < duration:
+            lat += speed * 0.514 * period / 111320.0
+            sentence = encode_dict({"type": 1, "mmsi": mmsi, "lat": round(lat, 5), "lon": round(lon, 5),
+                                    "speed": speed, "course": 0, "heading": 0, "second": int(t) % 60},
+                                   sentence_type="VDM")[0]
+            for receiver in range(receivers):
+                if rng.random() < coverage:
+                    # Stesso payload, canale radio diverso per ricevitore
+                    channel = "AB"[receiver % 2]
+                    arrivals.append((t + rng.uniform(0, 1.0), sentence.replace(",A,", f",{channel},", 1)))
+            t += period
+    arrivals.sort()
+    return arrivals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark di deduplicazione e diradamento prima della decodifica.")
+    parser.add_argument("--vessels", type=int, default=500)
+    parser.add_argument("--duration", type=float, default=600, help="Secondi simulati")
+    parser.add_argument("--receivers", type=int, default=3)
+    parser.add_argument("--coverage", type=float, default=0.8, help="Probabilità che un ricevitore senta un messaggio")
+    parser.add_argument("--window", type=float, default=5)
+    parser.add_argument("--thin-interval", type=float, default=30)
+    parser.add_argument("--thin-distance", type=float, default=100)
+    args = parser.parse_args()
+
+    arrivals = simulate(args.vessels, args.duration, args.receivers, args.coverage)
+    print(f"{len(arrivals):,} sentenze da {args.receivers} ricevitori, {args.vessels} navi, {args.duration:.0f} s simulati")
+
+    started = time.perf_counter()
+    for _, sentence in arrivals:
+        decode_assembled(sentence)
+    decode_all = time.perf_counter() - started
+    print(f"  solo decodifica:          {decode_all:6.2f} s  ({len(arrivals) / decode_all:,.0f} msg/s)")
+
+    variants = (("deduplicazione", 0, 0), ("dedup + diradamento", args.thin_interval, args.thin_distance),
+                ("dedup + solo distanza", 0, args.thin_distance))
+    for label, thin_interval, thin_distance in variants:
+        message_filter = MessageFilter(dedup_window=args.window, thin_interval=thin_interval,
+                                       thin_distance=thin_distance)
+        started = time.perf_counter()
+        accepted = [sentence for t, sentence in arrivals if message_filter.accept(sentence, t)]
+        filtered = time.perf_counter() - started
+        for sentence in accepted:
+            decode_assembled(sentence)
+        total = time.perf_counter() - started
+        print(f"  {label + ':':25} {total:6.2f} s  (filtro {len(arrivals) / filtered:,.0f} msg/s, "
+              f"decodificati {len(accepted):,}, {decode_all / total:.1f}x)")
+        print(f"    {message_filter.stats()}")
+
+
+if __name__ == "__main__":
+    main()
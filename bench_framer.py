@@ -0,0 +1,102 @@
+import argparse
+import itertools
+import time
+
+from nmea_framer import NMEAFramer
+
+
+# Micro-benchmark del framer NMEA.
+# Uso: python bench_framer.py [cattura_moxa.nmea ...] [--chunks 1 1024 65536] [--repeat 3]
+# Le catture sono i byte grezzi registrati dal Moxa (es. con `nc IP PORTA > cattura.nmea`).
+# Senza file viene usato un corpus sintetico con CRLF, LF e righe spurie.
+
+CHUNK_SIZES = (1, 1024, 64 * 1024)
+
+SAMPLE_SENTENCES = (
+    b"!AIVDM,1,1,,A,11mg=5OP1s0fdB0HbG`00001P000,0*67",
+    b"!AIVDM,1,1,,B,15NG6V0P01G?cFhE`R2IU?wn28R>,0*05",
+    b"!AIVDM,2,1,1,A,53cSch@00000T48<000p5HF18tl400000000000000000000000000000000,0*61",
+    b"!AIVDM,2,2,1,A,00000000000,2*27",
+    b"!AIVDM,1,1,,B,B5NJ;PP005l4ot5Isbl03wsUkP06,0*76",
+    b"$GPRMC,123519,A,4807.038,N,01131.000,E,022.4,084.4,230394,003.1,W*6A",
+)
+
+
+def synthetic_capture(lines=200_000):
+    terminators = itertools.cycle((b"\r\n", b"\r\n", b"\n", b"\r\n"))
+    sentences = itertools.cycle(SAMPLE_SENTENCES)
+    return b"".join(next(sentences) + next(terminators) for _ in range(lines))
+
+
+def legacy_split(chunks):
+    # Copia del vecchio ciclo di test_ok.py (concatenazione + doppio find), senza logging
+    received_buffer = b""
+    count = 0
+    for data in chunks:
+        received_buffer += data
+        while b'\r' in received_buffer or b'\n' in received_buffer:
+            cr_index = received_buffer.find(b'\r')
+            lf_index = received_buffer.find(b'\n')
+            if cr_index == -1:
+                delimiter_index = lf_index
+            elif lf_index == -1:
+                delimiter_index = cr_index
+            else:
+                delimiter_index = min(cr_index, lf_index)
+            raw_nmea_message_bytes = received_buffer[:delimiter_index]
+            received_buffer = received_buffer[delimiter_index + 1:]
+            if raw_nmea_message_bytes.endswith(b'\r') and received_buffer.startswith(b'\n'):
+                received_buffer = received_buffer[1:]
+            if raw_nmea_message_bytes:
+                count += 1
+        if len(received_buffer) > 1024 * 4:
+            received_buffer = b""
+    return count
+
+
+def framer_split(chunks):
+    framer = NMEAFramer()
+    count = 0
+    for data in chunks:
+        for _line in framer.feed(data):
+            count += 1
+    return count
+
+
+def run(name, split, payload, chunk_size, repeat=1):
+    chunks = [payload[i:i + chunk_size] for i in range(0, len(payload), chunk_size)]
+    # Miglior tempo su `repeat` passate, per ridurre il rumore
+    elapsed = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        lines = split(chunks)
+        elapsed = min(elapsed, time.perf_counter() - started)
+    print(f"{name:<8} chunk={chunk_size:>6}  righe={lines:>8}  {elapsed:8.3f}s  "
+          f"{lines / elapsed:>12,.0f} righe/s  {len(payload) / elapsed / 1e6:8.2f} MB/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del framer NMEA (righe al secondo).")
+    parser.add_argument("captures", nargs="*", help="File di cattura grezza del Moxa")
+    parser.add_argument("--chunks", nargs="+", type=int, default=CHUNK_SIZES, help="Dimensioni dei blocchi di ricezione")
+    parser.add_argument("--repeat", type=int, default=1, help="Passate per misura (si tiene la migliore)")
+    parser.add_argument("--legacy", action="store_true", help="Confronta anche con il vecchio ciclo di concatenazione")
+    args = parser.parse_args()
+
+    if args.captures:
+        payload = b""
+        for path in args.captures:
+            with open(path, "rb") as capture:
+                payload += capture.read()
+    else:
+        payload = synthetic_capture()
+    print(f"Corpus: {len(payload):,} bytes")
+
+    for chunk_size in args.chunks:
+        run("framer", framer_split, payload, chunk_size, args.repeat)
+        if args.legacy:
+            run("legacy", legacy_split, payload, chunk_size, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import argparse
+import ast
+import asyncio
+import collections
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from ais_corpus import synthetic_sentences
+from fake_moxa_server import FakeMoxaServer, load_capture, parse_speed
+
+
+# Suite di benchmark end-to-end del percorso di ingestione di test_ok.py.
+# Un finto Moxa (in questo processo) ripete il corpus verso test_ok.py avviato
+# in modalità non interattiva come sottoprocesso; alla fine si confrontano le
+# sentenze inviate con i record NDJSON scritti.
+# Uso: python bench_ingest.py [cattura.nmea ...] --messages 50000 --scenarios clean faults
+#      python bench_ingest.py --speed 20 --scenarios clean   (20x il tempo reale: latenza a regime)
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEST_OK = os.path.join(PACKAGE_DIR, "test_ok.py")
+
+SCENARIOS = {
+    "clean": {},
+    "fragmented": {"fragment": True},
+    "faults": {"fragment": True, "garbage_prob": 0.02, "interleave_multipart": 3, "drop_fragment_prob": 0.01},
+}
+
+_OUTPUT_SUMMARY = re.compile(r"Output chiuso: (\d+) record scritti, (\d+) scartati")
+_FILTER_STATS = re.compile(r"Filtro messaggi: (\{.*\})")
+
+
+class _ServerThread:
+    # Il finto Moxa gira nel suo event loop, in un thread separato
+
+    def __init__(self, server):
+        self.server = server
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.server.start(), self.loop).result()
+        return self.server
+
+    def __exit__(self, *exc_info):
+        asyncio.run_coroutine_threadsafe(self.server.stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+def _rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def _completes_message(sentence):
+    # Sentenza singola o ultimo frammento di un multi-part (numero frammento == totale)
+    fields = sentence.split(",", 3)
+    return len(fields) > 3 and fields[1] == fields[2]
+
+
+def _percentile(samples, p):
+    return samples[min(len(samples) - 1, int(len(samples) * p))] if samples else float("nan")
+
+
+def run_scenario(name, sentences, options, speed, rate, workers):
+    server = FakeMoxaServer(sentences, port=0, speed=speed, rate=rate, seed=7, record_send_times=True, **options)
+    with tempfile.TemporaryDirectory() as storage, _ServerThread(server):
+        env = dict(os.environ, AIS_STORAGE_DIR=storage, AIS_OUTPUT_FORMAT="ndjson", AIS_OUTPUT_COMPRESS="0",
+                   AIS_OUTPUT_MAX_BYTES=str(1 << 40), AIS_OUTPUT_MAX_AGE="0", AIS_DECODE_WORKERS=str(workers))
+        env.pop("AIS_DEBUG_LOG", None)
+        process = subprocess.Popen([sys.executable, TEST_OK, "127.0.0.1", str(server.port)], env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        stderr_lines = []
+        reader = threading.Thread(target=lambda: stderr_lines.extend(process.stderr), daemon=True)
+        reader.start()
+
+        # Memoria: prima misura a connessione avvenuta, poi picco e valore finale
+        rss_samples = []
+        while process.poll() is None:
+            if server.clients:
+                rss = _rss_kb(process.pid)
+                if rss:
+                    rss_samples.append(rss)
+            time.sleep(0.05)
+        reader.join()
+
+        records = []
+        with open(os.path.join(storage, "ais_decoded.ndjson"), "rb") as output:
+            for line in output:
+                records.append(json.loads(line))
+
+    # Latenza invio -> decodifica: il record si abbina all'ultima sentenza del messaggio nel corpus.
+    # test_ok.py non passa received_at, quindi "timestamp" è la fine della decodifica anche con i worker
+    positions = collections.defaultdict(collections.deque)
+    for index, sentence in enumerate(sentences):
+        positions[sentence].append(index)
+    latencies = []
+    for record in records:
+        raw = record["raw_nmea"]
+        last = raw[-1] if isinstance(raw, list) else raw
+        indices = positions.get(last)
+        if indices:
+            index = indices.popleft()
+            if index in server.send_times:
+                latencies.append(record["timestamp"] - server.send_times[index])
+    latencies.sort()
+
+    expected = sum(map(_completes_message, sentences))
+    written = dropped_output = 0
+    filter_stats = {}
+    for line in stderr_lines:
+        match = _OUTPUT_SUMMARY.search(line)
+        if match:
+            written, dropped_output = int(match.group(1)), int(match.group(2))
+        match = _FILTER_STATS.search(line)
+        if match:
+            filter_stats = ast.literal_eval(match.group(1))
+    # Gli scarti del filtro contano come persi: con un solo Moxa ogni messaggio del corpus è legittimo
+    # (anche i report statici ripetuti identici), la riga "filtro" dice quanti ne ha tolti
+    duplicates = filter_stats.get("dedup", {}).get("duplicates", 0)
+    thinned = filter_stats.get("thinning", {}).get("thinned", 0)
+    warnings = sum(1 for line in stderr_lines if " - WARNING - AVVISO" in line)
+    errors = sum(1 for line in stderr_lines if " - ERROR - " in line)
+    overflows = sum(1 for line in stderr_lines if "senza delimitatori" in line)
+
+    first_send = min(server.send_times.values()) if server.send_times else 0
+    last_record = max((record["timestamp"] for record in records), default=first_send)
+    elapsed = max(last_record - first_send, 1e-9)
+    print(f"\n[{name}] {len(sentences):,} sentenze, velocità {'massima' if speed is None else f'{speed}x'}, "
+          f"worker={workers}")
+    print(f"  throughput:   {server.sentences_sent / elapsed:,.0f} sentenze/s, {len(records) / elapsed:,.0f} msg/s "
+          f"({elapsed:.2f}s)")
+    if latencies:
+        print(f"  latenza invio->decodifica ms: p50={_percentile(latencies, 0.5) * 1000:.1f} "
+              f"p95={_percentile(latencies, 0.95) * 1000:.1f} p99={_percentile(latencies, 0.99) * 1000:.1f} "
+              f"max={latencies[-1] * 1000:.1f}")
+    if rss_samples:
+        print(f"  memoria RSS:  iniziale {rss_samples[0] / 1024:.1f} MB, picco {max(rss_samples) / 1024:.1f} MB, "
+              f"finale {rss_samples[-1] / 1024:.1f} MB (crescita {(rss_samples[-1] - rss_samples[0]) / 1024:+.1f} MB)")
+    print(f"  messaggi:     attesi {expected:,}, scritti {written:,}, persi {expected - written:,} "
+          f"(frammenti rimossi dal server {server.fragments_dropped}, scartati dal filtro {duplicates + thinned}, "
+          f"scartati dall'output {dropped_output})")
+    print(f"  filtro:       duplicati {duplicates:,}, posizioni diradate {thinned:,}")
+    print(f"  anomalie:     byte spuri iniettati {server.garbage_injected}, avvisi decodifica {warnings}, "
+          f"errori {errors}, overflow framer {overflows}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark end-to-end del percorso di ingestione AIS.")
+    parser.add_argument("captures", nargs="*", help="Catture NMEA da ripetere; senza, corpus sintetico")
+    parser.add_argument("--messages", type=int, default=50000, help="Messaggi del corpus sintetico")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=sorted(SCENARIOS))
+    parser.add_argument("--speed", type=parse_speed, default=None, help="Moltiplicatore del tempo reale o 'max'")
+    parser.add_argument("--rate", type=float, default=50, help="Sentenze/s del tempo reale")
+    parser.add_argument("--workers", type=int, default=0, help="AIS_DECODE_WORKERS per test_ok.py")
+    args = parser.parse_args()
+
+    if args.captures:
+        sentences = [sentence for path in args.captures for sentence in load_capture(path)]
+    else:
+        sentences = synthetic_sentences(args.messages)
+    for name in args.scenarios:
+        run_scenario(name, sentences, SCENARIOS[name], args.speed, args.rate, args.workers)
+
+
+if __name__ == "__main__":
+    main()
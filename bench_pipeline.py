@@ -0,0 +1,75 @@
+import argparse
+import os
+import time
+
+from ais_corpus import synthetic_messages
+from ais_pipeline import DecodePipeline, DecodeError, decode_batch
+
+
+# Benchmark della pipeline di decodifica: messaggi/s al variare del numero di worker.
+# Uso: python bench_pipeline.py --messages 100000 --workers 1 2 4 8 --batch-size 256
+# "inline" è la decodifica sul thread del lettore, come in test_ok.py senza pipeline.
+
+
+def bench_inline(messages):
+    started = time.perf_counter()
+    results = decode_batch([(None, 0.0, message) for message in messages])
+    return time.perf_counter() - started, results
+
+
+def bench_pipeline(messages, workers, batch_size):
+    pipeline = DecodePipeline(workers=workers, batch_size=batch_size)
+    # Avvio dei processi escluso dalla misura
+    time.sleep(0.2)
+    results = []
+    started = time.perf_counter()
+    for index, message in enumerate(messages):
+        # Il timestamp di ingresso è la posizione nel corpus, per verificare l'ordine per nave
+        pipeline.submit(message, float(index))
+        if pipeline.in_flight > batch_size * workers * 8:
+            for batch in pipeline.poll():
+                results.extend(batch)
+    pipeline.flush()
+    while pipeline.completed < pipeline.submitted:
+        for batch in pipeline.poll(timeout=0.1):
+            results.extend(batch)
+    elapsed = time.perf_counter() - started
+    pipeline.close()
+    return elapsed, results
+
+
+def check_ordering(results):
+    # Per ogni MMSI i timestamp del corpus devono uscire nello stesso ordine di ingresso
+    last_seen = {}
+    for result in results:
+        if isinstance(result, DecodeError):
+            continue
+        if result["timestamp"] < last_seen.get(result["mmsi"], -1):
+            return False
+        last_seen[result["mmsi"]] = result["timestamp"]
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput della pipeline di decodifica AIS.")
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--workers", nargs="+", type=int,
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument("--batch-size", type=int, default=256)
+    args = parser.parse_args()
+
+    messages = synthetic_messages(args.messages)
+    print(f"Corpus: {len(messages):,} messaggi (tipi 1/2/3/5/18/24), {os.cpu_count()} CPU")
+
+    elapsed, results = bench_inline(messages)
+    print(f"inline       {elapsed:7.2f}s  {len(messages) / elapsed:>10,.0f} msg/s")
+
+    for workers in args.workers:
+        elapsed, results = bench_pipeline(messages, workers, args.batch_size)
+        errors = sum(isinstance(result, DecodeError) for result in results)
+        print(f"workers={workers:<3}  {elapsed:7.2f}s  {len(messages) / elapsed:>10,.0f} msg/s  "
+              f"risultati={len(results):,} errori={errors} ordine per MMSI={'ok' if check_ordering(results) else 'VIOLATO'}")
+
+
+if __name__ == "__main__":
+    main()
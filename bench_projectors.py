@@ -0,0 +1,143 @@
+import argparse
+import collections
+import time
+
+from ais_corpus import EXTENDED_MIX, MESSAGE_MIX, synthetic_messages
+from ais_decoding import build_log_data, decode_assembled, decode_log_data
+from ais_projectors import COMPACT_FIELDS, FieldProjectors
+
+
+# Benchmark dell'estrazione dei campi: catena if/elif + getattr (versione precedente
+# di build_log_data) contro i proiettori precompilati di ais_projectors.py.
+# Uso: python bench_projectors.py --messages 200000 --repeat 5
+# Prima si misura solo l'estrazione (decodifica pyais fatta una volta prima delle misure),
+# poi decodifica + estrazione, dove contano i tipi che decode_log_data non passa a pyais.
+
+
+def legacy_build_log_data(assembled_message, decoded_ais_message, timestamp=None):
+    # Copia della vecchia build_log_data, tenuta solo come riferimento per il confronto
+    log_data = {
+        "timestamp": time.time() if timestamp is None else timestamp,
+        "raw_nmea": assembled_message,
+        "msg_type": decoded_ais_message.msg_type,
+        "mmsi": getattr(decoded_ais_message, 'mmsi', 'N/A'),
+        "decoded_fields": {}
+    }
+
+    if decoded_ais_message.msg_type in [1, 2, 3]:
+        log_data["decoded_fields"] = {
+            "status": getattr(decoded_ais_message, 'status', 'N/A'),
+            "lat": getattr(decoded_ais_message, 'lat', 'N/A'),
+            "lon": getattr(decoded_ais_message, 'lon', 'N/A'),
+            "speed": getattr(decoded_ais_message, 'speed', 'N/A'),
+            "course": getattr(decoded_ais_message, 'course', 'N/A'),
+            "heading": getattr(decoded_ais_message, 'heading', 'N/A')
+        }
+    elif decoded_ais_message.msg_type == 5:
+        log_data["decoded_fields"] = {
+            "shipname": getattr(decoded_ais_message, 'shipname', 'N/A'),
+            "ship_type": getattr(decoded_ais_message, 'ship_type', 'N/A'),
+            "callsign": getattr(decoded_ais_message, 'callsign', 'N/A'),
+            "imo": getattr(decoded_ais_message, 'imo', 'N/A'),
+            "dimensions": {
+                "to_bow": getattr(decoded_ais_message, 'to_bow', 'N/A'),
+                "to_stern": getattr(decoded_ais_message, 'to_stern', 'N/A'),
+                "to_port": getattr(decoded_ais_message, 'to_port', 'N/A'),
+                "to_starboard": getattr(decoded_ais_message, 'to_starboard', 'N/A')
+            }
+        }
+    elif decoded_ais_message.msg_type == 18:
+        log_data["decoded_fields"] = {
+            "lat": getattr(decoded_ais_message, 'lat', 'N/A'),
+            "lon": getattr(decoded_ais_message, 'lon', 'N/A'),
+            "speed": getattr(decoded_ais_message, 'speed', 'N/A'),
+            "course": getattr(decoded_ais_message, 'course', 'N/A'),
+            "unit": getattr(decoded_ais_message, 'unit', 'N/A')
+        }
+    elif decoded_ais_message.msg_type == 24:
+        log_data["decoded_fields"]["part_num"] = getattr(decoded_ais_message, 'part_num', 'N/A')
+        if hasattr(decoded_ais_message, 'shipname'):
+            log_data["decoded_fields"]["shipname"] = decoded_ais_message.shipname
+        if hasattr(decoded_ais_message, 'ship_type'):
+            log_data["decoded_fields"]["ship_type"] = decoded_ais_message.ship_type
+        if hasattr(decoded_ais_message, 'callsign'):
+            log_data["decoded_fields"]["callsign"] = decoded_ais_message.callsign
+    else:
+        log_data["decoded_fields"] = decoded_ais_message.to_dict()
+        log_data["decoded_fields"].pop('msg_type', None)
+        log_data["decoded_fields"].pop('mmsi', None)
+
+    return log_data
+
+
+def measure(decoded, extractors, repeat):
+    # Miglior tempo su `repeat` passate per ogni estrazione, alternate a ogni passata perché le
+    # derive della macchina pesino su tutte allo stesso modo; conta i messaggi che sollevano eccezioni
+    best = [float("inf")] * len(extractors)
+    failures = [0] * len(extractors)
+    for _ in range(repeat):
+        for index, extract in enumerate(extractors):
+            failures[index] = 0
+            started = time.perf_counter()
+            for assembled, message in decoded:
+                try:
+                    extract(assembled, message, 0.0)
+                except Exception:
+                    failures[index] += 1
+            best[index] = min(best[index], time.perf_counter() - started)
+    return best, failures
+
+
+def report(labels, count, best, failures):
+    for label, elapsed, failed in zip(labels, best, failures):
+        ratio = "" if elapsed is best[0] else f"{best[0] / elapsed:.2f}x, "
+        print(f"  {label + ':':27}{count / elapsed:12,.0f} msg/s  ({ratio}errori: {failed})")
+
+
+def run(name, messages, repeat, selection):
+    decoded = [(assembled, decode_assembled(assembled)) for assembled in messages]
+    types = collections.Counter(message.msg_type for _, message in decoded)
+    print(f"\n[{name}] {len(decoded):,} messaggi, tipi: "
+          + ", ".join(f"{msg_type}={count}" for msg_type, count in sorted(types.items())))
+    projectors = FieldProjectors(fields=())
+    selected = FieldProjectors(fields=selection)
+
+    # La vecchia estrazione fallisce sui tipi 6/8 (to_dict() non esiste in pyais 3): errori contati a parte
+    best, failures = measure(decoded, [legacy_build_log_data,
+                                       lambda a, m, t: build_log_data(a, m, t, projectors),
+                                       lambda a, m, t: build_log_data(a, m, t, selected)], repeat)
+    report(["if/elif + getattr", "proiettori, schema intero", f"proiettori, {len(selection)} campi"],
+           len(decoded), best, failures)
+
+    # Decodifica + estrazione: con una selezione i tipi senza campi selezionati saltano pyais
+    raw = [(assembled, None) for assembled, _ in decoded]
+    best, failures = measure(raw, [lambda a, m, t: legacy_build_log_data(a, decode_assembled(a), t),
+                                   lambda a, m, t: decode_log_data(a, t, projectors),
+                                   lambda a, m, t: decode_log_data(a, t, selected)], repeat)
+    report(["decodifica + if/elif", "decodifica, schema intero", f"decodifica, {len(selection)} campi"],
+           len(raw), best, failures)
+    print(f"  tipi non decodificati con {len(selection)} campi: {sorted(selected.skipped_types & set(types))}")
+
+    # Costo a freddo: compilazione dei proiettori alla prima occorrenza di ogni classe
+    classes = {type(message): message for _, message in decoded}
+    cold = FieldProjectors(fields=())
+    started = time.perf_counter()
+    for message in classes.values():
+        cold.project(message)
+    print(f"  compilazione di {len(classes)} proiettori: {(time.perf_counter() - started) * 1000:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dell'estrazione dei campi AIS decodificati.")
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--fields", default=",".join(COMPACT_FIELDS),
+                        help="Campi selezionati per la terza misura (separati da virgola, predefiniti quelli di AIS_FIELDS=compact)")
+    args = parser.parse_args()
+    selection = tuple(name for name in args.fields.split(",") if name)
+    run("mix esteso", synthetic_messages(args.messages, mix=EXTENDED_MIX), args.repeat, selection)
+    run("mix porto", synthetic_messages(args.messages, mix=MESSAGE_MIX), args.repeat, selection)
+
+
+if __name__ == "__main__":
+    main()
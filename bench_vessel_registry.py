@@ -0,0 +1,110 @@
+import argparse
+import random
+import time
+
+from vessel_registry import VesselRegistry
+
+
+# Benchmark del registro navi: velocità di aggiornamento e latenza delle query.
+# Uso: python bench_vessel_registry.py --vessels 50000 100000 --queries 2000
+# Le navi sono distribuite nel Mediterraneo e si spostano a ogni aggiornamento. Con --repeat N ogni
+# query si ripete N volte e conta il tempo migliore, per togliere il rumore dello scheduler.
+
+AREA = (-6.0, 30.0, 36.0, 46.0)
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda p: samples[min(len(samples) - 1, int(len(samples) * p))] * 1e6
+    return f"p50={pick(0.50):7.1f}µs p99={pick(0.99):7.1f}µs max={samples[-1] * 1e6:7.1f}µs"
+
+
+def timed(queries, function, repeat=1):
+    samples = []
+    results = 0
+    for args in queries:
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = function(*args)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        samples.append(best)
+        results += len(result) if result is not None else 0
+    return samples, results / len(queries)
+
+
+def run(vessels, updates, queries, repeat=1, seed=42):
+    rng = random.Random(seed)
+    lon_min, lat_min, lon_max, lat_max = AREA
+    registry = VesselRegistry()
+    fleet = [200000000 + i for i in range(vessels)]
+    positions = {mmsi: [rng.uniform(lat_min, lat_max), rng.uniform(lon_min, lon_max)] for mmsi in fleet}
+    now = time.time()
+
+    # Popolamento iniziale: posizione + dati statici (tipo 5)
+    started = time.perf_counter()
+    for mmsi in fleet:
+        lat, lon = positions[mmsi]
+        registry.update_position(mmsi, lat, lon, speed=10.0, course=90.0, heading=90, status=0, timestamp=now)
+        registry.update_static(mmsi, shipname=f"NAVE {mmsi % 100000}", callsign="IABC", ship_type=70,
+                               imo=9000000, to_bow=100, to_stern=20, to_port=10, to_starboard=10, timestamp=now)
+    elapsed = time.perf_counter() - started
+    print(f"\n{vessels:,} navi: popolamento {2 * vessels / elapsed:,.0f} aggiornamenti/s")
+
+    # Aggiornamenti di posizione con piccoli spostamenti (cambi di cella inclusi)
+    moves = []
+    for _ in range(updates):
+        mmsi = rng.choice(fleet)
+        position = positions[mmsi]
+        position[0] = min(lat_max, max(lat_min, position[0] + rng.uniform(-0.02, 0.02)))
+        position[1] = min(lon_max, max(lon_min, position[1] + rng.uniform(-0.02, 0.02)))
+        moves.append((mmsi, position[0], position[1]))
+    started = time.perf_counter()
+    for mmsi, lat, lon in moves:
+        registry.update_position(mmsi, lat, lon, speed=12.0, course=45.0, timestamp=now + 1)
+    elapsed = time.perf_counter() - started
+    print(f"  update_position: {updates / elapsed:,.0f} aggiornamenti/s")
+
+    log_data = [{"timestamp": now + 2, "msg_type": 1, "mmsi": mmsi,
+                 "decoded_fields": {"status": 0, "lat": lat, "lon": lon, "speed": 12.0, "course": 45.0, "heading": 45}}
+                for mmsi, lat, lon in moves]
+    started = time.perf_counter()
+    for record in log_data:
+        registry.apply(record)
+    elapsed = time.perf_counter() - started
+    print(f"  apply(log_data): {updates / elapsed:,.0f} aggiornamenti/s")
+
+    points = [(rng.uniform(lat_min + 1, lat_max - 1), rng.uniform(lon_min + 1, lon_max - 1)) for _ in range(queries)]
+    samples, _ = timed([(rng.choice(fleet),) for _ in range(queries)], lambda mmsi: [registry.get(mmsi)], repeat)
+    print(f"  get(mmsi):            {percentiles(samples)}")
+    samples, found = timed([(lon - 0.25, lat - 0.25, lon + 0.25, lat + 0.25) for lat, lon in points], registry.bbox, repeat)
+    print(f"  bbox 0.5°x0.5°:       {percentiles(samples)}  media {found:.1f} navi")
+    samples, found = timed([(lat, lon, 20000) for lat, lon in points], registry.radius, repeat)
+    print(f"  radius 20 km:         {percentiles(samples)}  media {found:.1f} navi")
+    samples, found = timed([(lat, lon, 10) for lat, lon in points], registry.nearest, repeat)
+    print(f"  nearest 10:           {percentiles(samples)}  media {found:.1f} navi")
+    # Punti lontani dalle navi (Atlantico, Pacifico meridionale, resto del globo): la ricerca ad anelli
+    # attraversa molte celle vuote prima di trovare la prima nave
+    far = [(0.0, -30.0), (-60.0, 150.0)] + [(rng.uniform(-80, 0), rng.uniform(-180, 180)) for _ in range(198)]
+    samples, found = timed([(lat, lon, 10) for lat, lon in far], registry.nearest, repeat)
+    print(f"  nearest 10 lontano:   {percentiles(samples)}  media {found:.1f} navi")
+
+    started = time.perf_counter()
+    removed = registry.expire(now + registry.ttl + 3)
+    print(f"  expire: {removed:,} navi rimosse in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del registro navi in memoria.")
+    parser.add_argument("--vessels", nargs="+", type=int, default=[50000, 100000])
+    parser.add_argument("--updates", type=int, default=500000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=1, help="Ripetizioni per query (conta la migliore)")
+    args = parser.parse_args()
+    for vessels in args.vessels:
+        run(vessels, args.updates, args.queries, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
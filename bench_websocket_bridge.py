@@ -0,0 +1,166 @@
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import random
+import resource
+import statistics
+import time
+
+from websockets.asyncio.client import connect
+
+from ais_websocket_bridge import AISWebSocketBridge
+
+
+# Test di carico del bridge WebSocket.
+# Uso: python bench_websocket_bridge.py --subscribers 1000 5000 --rate 200 --duration 15
+# Il bridge gira nel processo principale (di cui misuriamo la CPU); i client
+# sono distribuiti su più processi e misurano la latenza tra la pubblicazione
+# (campo "timestamp") e la ricezione del frame.
+
+SUBSCRIBER_COUNTS = (1000, 5000)
+# Area di test (Tirreno settentrionale) e flotta sintetica
+AREA = (8.0, 40.0, 14.0, 45.0)
+FLEET_SIZE = 2000
+
+
+def _random_filter(rng, fleet):
+    # Mix di sottoscrizioni tipico: tutto, per tipo, per bbox, per singole navi
+    kind = rng.random()
+    if kind < 0.25:
+        return {}
+    if kind < 0.5:
+        return {"msg_types": [1, 2, 3, 18]}
+    if kind < 0.85:
+        lon = rng.uniform(AREA[0], AREA[2] - 1.0)
+        lat = rng.uniform(AREA[1], AREA[3] - 1.0)
+        return {"bbox": [lon, lat, lon + 1.0, lat + 1.0]}
+    return {"mmsi": rng.sample(fleet, 5)}
+
+
+async def _client_group(port, filters, ready, stop, results):
+    latencies = []
+    received = 0
+
+    async def client(subscription):
+        nonlocal received
+        async with connect(f"ws://127.0.0.1:{port}", compression=None, open_timeout=60, max_queue=None) as websocket:
+            await websocket.send(json.dumps(subscription))
+            await websocket.recv()  # conferma della sottoscrizione
+            ready.release()
+            while True:
+                frame = await websocket.recv()
+                now = time.time()
+                received += 1
+                latencies.append(now - json.loads(frame)["timestamp"])
+
+    tasks = []
+    for subscription in filters:
+        tasks.append(asyncio.create_task(client(subscription)))
+        await asyncio.sleep(0)
+    while not stop.is_set():
+        await asyncio.sleep(0.2)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    # Campioniamo le latenze per non trasferire milioni di valori tra processi
+    if len(latencies) > 50000:
+        latencies = random.sample(latencies, 50000)
+    results.put((received, latencies))
+
+
+def _client_process(port, filters, ready, stop, results):
+    asyncio.run(_client_group(port, filters, ready, stop, results))
+
+
+def _synthetic_message(rng, fleet):
+    mmsi = rng.choice(fleet)
+    msg_type = rng.choice((1, 1, 1, 3, 18, 18, 5))
+    if msg_type == 5:
+        fields = {"shipname": f"NAVE {mmsi % 1000}", "ship_type": 70, "callsign": "IABC", "imo": 0}
+    else:
+        fields = {"lat": rng.uniform(AREA[1], AREA[3]), "lon": rng.uniform(AREA[0], AREA[2]),
+                  "speed": 12.3, "course": 181.5, "heading": 180}
+    return {"timestamp": time.time(), "raw_nmea": "!AIVDM,1,1,,A,...", "msg_type": msg_type,
+            "mmsi": mmsi, "decoded_fields": fields}
+
+
+async def _run(subscribers, rate, duration, processes):
+    rng = random.Random(42)
+    fleet = [247000000 + i for i in range(FLEET_SIZE)]
+    bridge = AISWebSocketBridge()
+    ctx = multiprocessing.get_context("spawn")
+    ready = ctx.Semaphore(0)
+    stop = ctx.Event()
+    results = ctx.Queue()
+
+    async with bridge.serve("127.0.0.1", 0) as server:
+        port = next(iter(server.sockets)).getsockname()[1]
+        filters = [_random_filter(rng, fleet) for _ in range(subscribers)]
+        workers = []
+        for i in range(processes):
+            worker = ctx.Process(target=_client_process, args=(port, filters[i::processes], ready, stop, results))
+            worker.start()
+            workers.append(worker)
+
+        for _ in range(subscribers):
+            while not ready.acquire(block=False):
+                await asyncio.sleep(0.01)
+        print(f"{subscribers} client connessi, pubblicazione a {rate} msg/s per {duration}s...")
+
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        interval = 1.0 / rate
+        next_at = wall_start
+        while time.perf_counter() - wall_start < duration:
+            bridge.publish(_synthetic_message(rng, fleet))
+            next_at += interval
+            delay = next_at - time.perf_counter()
+            await asyncio.sleep(max(delay, 0))
+        # Lasciamo svuotare le code dei client
+        while any(subscriber.queue for subscriber in bridge._subscribers):
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(0.5)
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        stats = bridge.stats()
+
+        stop.set()
+        received = 0
+        latencies = []
+        for _ in workers:
+            count, samples = await asyncio.get_running_loop().run_in_executor(None, results.get)
+            received += count
+            latencies.extend(samples)
+        for worker in workers:
+            worker.join()
+
+    latencies.sort()
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else float("nan")
+    print(f"  frame accodati={stats['frames_enqueued']:,} inviati={stats['frames_sent']:,} "
+          f"scartati={stats['frames_dropped']:,} ricevuti={received:,}")
+    print(f"  latenza ms: p50={percentile(0.50):.1f} p95={percentile(0.95):.1f} "
+          f"p99={percentile(0.99):.1f} max={latencies[-1] * 1000 if latencies else float('nan'):.1f} "
+          f"media={statistics.fmean(latencies) * 1000 if latencies else float('nan'):.1f}")
+    print(f"  CPU del bridge: {cpu:.2f}s su {wall:.2f}s ({100 * cpu / wall:.0f}%), "
+          f"RSS max {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test di carico del bridge WebSocket AIS.")
+    parser.add_argument("--subscribers", nargs="+", type=int, default=SUBSCRIBER_COUNTS)
+    parser.add_argument("--rate", type=int, default=200, help="Messaggi pubblicati al secondo")
+    parser.add_argument("--duration", type=float, default=15, help="Durata della pubblicazione in secondi")
+    parser.add_argument("--processes", type=int, default=max(1, multiprocessing.cpu_count() - 1),
+                        help="Processi client")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    for subscribers in args.subscribers:
+        asyncio.run(_run(subscribers, args.rate, args.duration, args.processes))
+
+
+if __name__ == "__main__":
+    main()
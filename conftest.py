@@ -0,0 +1,2 @@
+# test_ok.py è il lettore del Moxa, non un file di test: importarlo configura il logging su /app/storage
+collect_ignore = ["test_ok.py"]
@@ -0,0 +1,234 @@
+import argparse
+import asyncio
+import logging
+import random
+import time
+
+from ais_corpus import synthetic_sentences
+
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURAZIONE DEL FINTO MOXA ---
+FAKE_MOXA_PORT = 10001
+BASE_RATE = 50              # sentenze/s in "tempo reale" (ricevitore costiero trafficato)
+MAX_SPEED_CHUNK = 64 * 1024
+
+GARBAGE_SAMPLES = (
+    b"\x00\xff\xfe\x13",
+    b"ATZ\r\n",
+    b"$PMOXA,STATUS,OK*00\r\n",
+    b"!AIVDM,1,1,,A,corrotto",
+    b"\xc3\x28\xa0\xa1 rumore seriale",
+)
+
+
+def load_capture(path):
+    # Una cattura registrata dal Moxa: una sentenza per riga, CR/LF indifferenti
+    with open(path, "rb") as capture:
+        return [line.strip().decode("ascii", errors="ignore") for line in capture.read().splitlines() if line.strip()]
+
+
+class FakeMoxaServer:
+    """Server TCP che si comporta come un Moxa NPort collegato a un ricevitore AIS.
+
+    Ripete le sentenze date (cattura registrata o corpus sintetico) a ogni
+    client che si connette, alla velocità richiesta: ``speed=1`` è il tempo
+    reale (``rate`` sentenze/s), ``speed=N`` è N volte più veloce,
+    ``speed=None`` è la massima velocità possibile. Può iniettare i guasti
+    visti sul campo: scritture frammentate, byte spuri, multi-part
+    interlacciati o con frammenti mancanti, disconnessioni.
+    """
+
+    def __init__(self, sentences, host="127.0.0.1", port=FAKE_MOXA_PORT, rate=BASE_RATE, speed=1.0,
+                 loop=False, fragment=False, garbage_prob=0.0, interleave_multipart=0,
+                 drop_fragment_prob=0.0, disconnect_after=None, line_ending=b"\r\n", seed=None,
+                 record_send_times=False):
+        self.sentences = list(sentences)
+        self.host = host
+        self.port = port
+        self.rate = rate
+        self.speed = speed
+        self.loop = loop
+        self.fragment = fragment
+        self.garbage_prob = garbage_prob
+        self.interleave_multipart = interleave_multipart
+        self.drop_fragment_prob = drop_fragment_prob
+        self.disconnect_after = disconnect_after
+        self.line_ending = line_ending
+        self.record_send_times = record_send_times
+        self._rng = random.Random(seed)
+        self._server = None
+
+        # Statistiche (cumulative su tutti i client)
+        self.clients = 0
+        self.sentences_sent = 0
+        self.bytes_sent = 0
+        self.garbage_injected = 0
+        self.fragments_dropped = 0
+        self.disconnects = 0
+        # Indice della sentenza nel corpus -> istante di invio (time.time()), se richiesto
+        self.send_times = {}
+
+    def _schedule(self):
+        # Ordine di trasmissione: i frammenti successivi al primo possono essere
+        # ritardati di qualche sentenza (multi-part interlacciati) o persi.
+        pending = []
+        for index, sentence in enumerate(self.sentences):
+            fields = sentence.split(",", 3)
+            is_later_fragment = len(fields) > 3 and fields[1] not in ("", "1") and fields[2] not in ("", "1")
+            if is_later_fragment and self.drop_fragment_prob and self._rng.random() < self.drop_fragment_prob:
+                self.fragments_dropped += 1
+                continue
+            if is_later_fragment and self.interleave_multipart:
+                pending.append([self.interleave_multipart, index, sentence])
+                continue
+            yield index, sentence
+            for item in pending:
+                item[0] -= 1
+            while pending and pending[0][0] <= 0:
+                _, pending_index, pending_sentence = pending.pop(0)
+                yield pending_index, pending_sentence
+        for _, pending_index, pending_sentence in pending:
+            yield pending_index, pending_sentence
+
+    def _encode(self, sentence):
+        data = sentence.encode("ascii") + self.line_ending
+        if self.garbage_prob and self._rng.random() < self.garbage_prob:
+            self.garbage_injected += 1
+            data = self._rng.choice(GARBAGE_SAMPLES) + data
+        return data
+
+    async def _write(self, writer, data):
+        if self.fragment and len(data) > 1:
+            # Scritture spezzate in punti casuali, come i pacchetti del Moxa con timeout di inter-carattere
+            offset = 0
+            while offset < len(data):
+                size = self._rng.randint(1, max(1, len(data) - offset))
+                writer.write(data[offset:offset + size])
+                await writer.drain()
+                offset += size
+        else:
+            writer.write(data)
+        self.bytes_sent += len(data)
+
+    async def _replay(self, writer):
+        rate = None if self.speed is None else self.rate * self.speed
+        started = time.perf_counter()
+        sent = 0
+        while True:
+            chunk = []
+            chunk_indices = []
+            chunk_size = 0
+            for index, sentence in self._schedule():
+                data = self._encode(sentence)
+                if rate is None:
+                    # Massima velocità: accumuliamo e scriviamo a blocchi
+                    chunk.append(data)
+                    chunk_indices.append(index)
+                    chunk_size += len(data)
+                    if chunk_size >= MAX_SPEED_CHUNK:
+                        await self._flush_chunk(writer, chunk, chunk_indices)
+                        chunk, chunk_indices, chunk_size = [], [], 0
+                else:
+                    delay = started + sent / rate - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    if self.record_send_times:
+                        self.send_times[index] = time.time()
+                    await self._write(writer, data)
+                    await writer.drain()
+                sent += 1
+                self.sentences_sent += 1
+                if self.disconnect_after and sent % self.disconnect_after == 0:
+                    await self._flush_chunk(writer, chunk, chunk_indices)
+                    self.disconnects += 1
+                    logger.info(f"Disconnessione simulata dopo {sent} sentenze.")
+                    return
+            await self._flush_chunk(writer, chunk, chunk_indices)
+            if not self.loop:
+                return
+
+    async def _flush_chunk(self, writer, chunk, chunk_indices):
+        if not chunk:
+            return
+        if self.record_send_times:
+            now = time.time()
+            for index in chunk_indices:
+                self.send_times[index] = now
+        await self._write(writer, b"".join(chunk))
+        await writer.drain()
+        chunk.clear()
+        chunk_indices.clear()
+
+    async def _handle_client(self, reader, writer):
+        peer = writer.get_extra_info("peername")
+        self.clients += 1
+        logger.info(f"Client connesso: {peer}")
+        try:
+            await self._replay(writer)
+        except (ConnectionResetError, BrokenPipeError):
+            logger.info(f"Client disconnesso: {peer}")
+        finally:
+            writer.close()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Finto Moxa in ascolto su {self.host}:{self.port} ({len(self.sentences)} sentenze, "
+                    f"velocità {'massima' if self.speed is None else f'{self.speed}x'})")
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def serve_forever(self):
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+
+def parse_speed(value):
+    # "max" oppure un moltiplicatore del tempo reale (1 = tempo reale)
+    return None if value.lower() == "max" else float(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Finto Moxa: ripete catture NMEA via TCP con guasti iniettabili.")
+    parser.add_argument("captures", nargs="*", help="File di cattura (una sentenza per riga); senza, corpus sintetico")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=FAKE_MOXA_PORT)
+    parser.add_argument("--messages", type=int, default=10000, help="Messaggi del corpus sintetico")
+    parser.add_argument("--rate", type=float, default=BASE_RATE, help="Sentenze/s in tempo reale")
+    parser.add_argument("--speed", type=parse_speed, default=1.0, help="Moltiplicatore del tempo reale oppure 'max'")
+    parser.add_argument("--loop", action="store_true", help="Ripete il corpus all'infinito")
+    parser.add_argument("--fragment", action="store_true", help="Spezza le scritture in punti casuali")
+    parser.add_argument("--garbage-prob", type=float, default=0.0, help="Probabilità di byte spuri prima di una sentenza")
+    parser.add_argument("--interleave-multipart", type=int, default=0,
+                        help="Ritarda i frammenti successivi dei multi-part di N sentenze")
+    parser.add_argument("--drop-fragment-prob", type=float, default=0.0,
+                        help="Probabilità di perdere un frammento successivo di un multi-part")
+    parser.add_argument("--disconnect-after", type=int, default=None, help="Chiude la connessione ogni N sentenze")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.captures:
+        sentences = [sentence for path in args.captures for sentence in load_capture(path)]
+    else:
+        sentences = synthetic_sentences(args.messages)
+    server = FakeMoxaServer(sentences, host=args.host, port=args.port, rate=args.rate, speed=args.speed,
+                            loop=args.loop, fragment=args.fragment, garbage_prob=args.garbage_prob,
+                            interleave_multipart=args.interleave_multipart,
+                            drop_fragment_prob=args.drop_fragment_prob,
+                            disconnect_after=args.disconnect_after, seed=args.seed)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        logger.info("Interrotto dall'utente.")
+
+
+if __name__ == "__main__":
+    main()
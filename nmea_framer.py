@@ -0,0 +1,150 @@
+import re
+
+
+# Dimensione predefinita del buffer di ricezione (un solo buffer riutilizzato per tutta la connessione)
+FRAMER_BUFFER_SIZE = 64 * 1024
+# Una sentenza NMEA è al massimo 82 caratteri, ma con i tag block può allungarsi.
+# Oltre questa soglia senza delimitatori consideriamo il flusso corrotto.
+MAX_LINE_LENGTH = 4096
+
+_DELIMITER = re.compile(rb'[\r\n]')
+
+
+class NMEAFramer:
+    """Suddivide uno stream TCP in sentenze NMEA senza copie intermedie.
+
+    I dati vengono ricevuti direttamente in un bytearray preallocato
+    (``recv_into``) oppure copiati una sola volta (``feed``). Le righe
+    complete vengono restituite come ``memoryview`` sul buffer interno:
+    restano valide solo fino alla successiva ricezione, quindi chi le
+    consuma deve convertirle (``bytes()``/``str()``) se vuole conservarle.
+    """
+
+    def __init__(self, buffer_size=FRAMER_BUFFER_SIZE, max_line_length=MAX_LINE_LENGTH, on_overflow=None):
+        if max_line_length > buffer_size:
+            raise ValueError(f"max_line_length ({max_line_length}) non può superare buffer_size ({buffer_size}).")
+        self._buf = bytearray(buffer_size)
+        self._view = memoryview(self._buf)
+        self._start = 0     # inizio della riga in corso (dati non ancora consumati)
+        self._scan = 0      # fino a qui sappiamo già che non ci sono delimitatori
+        self._end = 0       # fine dei dati validi nel buffer
+        self._discarding = False
+        self.max_line_length = max_line_length
+        # Callback opzionale invocata con i byte scartati prima di perderli
+        self.on_overflow = on_overflow
+
+        # Statistiche
+        self.bytes_received = 0
+        self.lines_framed = 0
+        self.overflow_count = 0
+        self.discarded_bytes = 0
+
+    @property
+    def pending(self):
+        # Byte della riga incompleta in attesa del prossimo delimitatore
+        return self._end - self._start
+
+    def _reserve(self):
+        # Restituisce una vista sullo spazio libero in coda, compattando il buffer se necessario
+        if self._start == self._end:
+            self._start = self._scan = self._end = 0
+        elif self._end == len(self._buf) and self._start > 0:
+            # Sposta solo la coda (la riga incompleta) all'inizio del buffer
+            tail = self._end - self._start
+            self._buf[:tail] = bytes(self._view[self._start:self._end])
+            self._scan = max(self._scan - self._start, 0)
+            self._start = 0
+            self._end = tail
+        return self._view[self._end:]
+
+    def _commit(self, nbytes):
+        self._end += nbytes
+        self.bytes_received += nbytes
+
+    def recv_into(self, sock):
+        """Riceve dal socket direttamente nel buffer. Restituisce il numero di byte letti (0 = EOF)."""
+        nbytes = sock.recv_into(self._reserve())
+        self._commit(nbytes)
+        return nbytes
+
+    def get_buffer(self):
+        """Spazio libero per la ricezione, da usare con ``asyncio.BufferedProtocol``."""
+        return self._reserve()
+
+    def buffer_updated(self, nbytes):
+        """Registra ``nbytes`` scritti nello spazio restituito da ``get_buffer``."""
+        self._commit(nbytes)
+
+    def feed(self, data):
+        """Copia ``data`` nel buffer e restituisce la lista delle sentenze complete.
+
+        Tutto ``data`` viene consumato subito, anche se il risultato non
+        viene letto. Le sentenze sono ``memoryview`` sul buffer interno;
+        se ``data`` non entra nello spazio libero il buffer viene compattato
+        durante la copia e le sentenze sono restituite come ``bytes``.
+        Percorso veloce (es. blocchi di pochi byte): se ``data`` entra nel
+        buffer e non contiene delimitatori non si esegue la regex sul
+        buffer, si controlla solo l'overflow.
+        """
+        start = self._end
+        end = start + len(data)
+        if end > len(self._buf):
+            return self._feed_chunks(data)
+        self._buf[start:end] = data
+        self._end = end
+        self.bytes_received += end - start
+        # Solo se il buffer era già stato esaminato fino a start (es. dopo recv_into senza lines())
+        if self._scan >= start and _DELIMITER.search(data) is None:
+            self._scan = end
+            if end - self._start >= self.max_line_length:
+                self._overflow()
+            return []
+        return list(self.lines())
+
+    def _feed_chunks(self, data):
+        # Dati più grandi dello spazio libero: copia a blocchi, compattando il buffer tra un blocco e l'altro.
+        # La compattazione sovrascrive le righe già estratte, quindi vanno copiate in bytes
+        lines = []
+        total = len(data)
+        offset = 0
+        while offset < total:
+            space = len(self._buf) - self._end
+            if not space or self._start == self._end:
+                space = len(self._reserve())
+            count = min(space, total - offset)
+            self._buf[self._end:self._end + count] = data[offset:offset + count]
+            self._commit(count)
+            offset += count
+            lines.extend(map(bytes, self.lines()))
+        return lines
+
+    def lines(self):
+        """Produce le sentenze complete presenti nel buffer (senza delimitatori, righe vuote escluse)."""
+        end = self._end
+        view = self._view
+        for match in _DELIMITER.finditer(self._buf, max(self._scan, self._start), end):
+            line_start = self._start
+            line_end = match.start()
+            self._start = match.end()
+            if self._discarding:
+                # La prima riga dopo un overflow è il resto di quella scartata
+                self._discarding = False
+                self.discarded_bytes += line_end - line_start
+            elif line_end > line_start:
+                self.lines_framed += 1
+                yield view[line_start:line_end]
+        self._scan = end
+        if end - self._start >= self.max_line_length:
+            self._overflow()
+
+    def _overflow(self):
+        # Troppi byte senza delimitatore: scartiamo la riga incompleta e tutto
+        # quello che arriva fino al prossimo CR/LF, invece di svuotare l'intero buffer.
+        dropped = self._end - self._start
+        if not self._discarding:
+            if self.on_overflow is not None:
+                self.on_overflow(self._view[self._start:self._end])
+            self.overflow_count += 1
+        self.discarded_bytes += dropped
+        self._discarding = True
+        self._start = self._scan = self._end = 0
@@ -4,15 +4,24 @@ import os
 import logging
 import json
 import sys
-from pyais import decode
+from ais_metrics import (REGISTRY, BYTES_RECEIVED, SENTENCES_RECEIVED, NON_NMEA_LINES, BUFFER_OVERFLOWS,
+                         DECODED_MESSAGES, DECODE_ERRORS, STAGE_LATENCY, start_metrics_server)
 from pyais.exceptions import UnknownMessageException, MissingMultipartMessageException # Importa anche questa eccezione
-from pyais.messages import NMEAMessageAssembler # <--- NUOVA IMPORTAZIONE
+from ais_decoding import NMEAMessageAssembler, decode_log_data
+from ais_dedup import MessageFilter, register_filter_metrics
+from ais_output import OUTPUT_FORMAT, AISOutputWriter
+from ais_pipeline import DECODE_WORKERS, DecodeError, DecodePipeline
+from nmea_framer import NMEAFramer
+from vessel_registry import VesselRegistry
 
 
 # --- CONFIGURAZIONE LOGGING (resta come prima) ---
-LOG_DIRECTORY = "/app/storage"
+LOG_DIRECTORY = os.environ.get("AIS_STORAGE_DIR", "/app/storage")
 LOG_FILE_NAME = "ais_output.log"
 LOG_FILE_PATH = os.path.join(LOG_DIRECTORY, LOG_FILE_NAME)
+# Log di ogni singolo messaggio (RAW NMEA / DECODED AIS) solo per debug: in produzione
+# i messaggi vanno all'output batch in background (vedi ais_output.py)
+DEBUG_MESSAGE_LOG = os.environ.get("AIS_DEBUG_LOG", "0") == "1"
 
 os.makedirs(LOG_DIRECTORY, exist_ok=True)
 
@@ -27,9 +36,64 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 # --- FINE CONFIGURAZIONE LOGGING ---
 
+# Ogni quanti secondi rimuovere dal registro le navi non più sentite
+VESSEL_EXPIRE_INTERVAL = 60
 
-# Configurazione generale del socket
-BUFFER_SIZE = 1024 
+
+def log_buffer_overflow(dropped):
+    # Invocata dal framer prima di scartare una riga troppo lunga senza delimitatori
+    logger.warning(f"ATTENZIONE: Buffer dati in crescita ({len(dropped)} bytes) senza delimitatori. Scarto la riga incompleta.")
+    logger.warning(f"Contenuto parziale del buffer (inizio): {str(dropped[:100], 'ascii', errors='replace')}...")
+
+def register_reader_metrics(source, assembler, message_filter, vessel_registry, output_writer, decode_pipeline):
+    # Stato letto solo quando l'endpoint delle metriche viene interrogato: nessun costo nel ciclo di lettura
+    REGISTRY.callback("ais_assembler_pending_fragments", "Frammenti multi-part in attesa di completamento.",
+                      lambda: [((source,), getattr(assembler, "pending_fragments", None))], labelnames=["source"])
+    REGISTRY.callback("ais_assembler_timeouts_total", "Multi-part incompleti scartati per timeout.",
+                      lambda: [((source,), getattr(assembler, "timeouts", None))], kind="counter",
+                      labelnames=["source"])
+    REGISTRY.callback("ais_queue_depth", "Elementi in attesa nelle code interne.",
+                      lambda: [(("output",), output_writer.queue_depth if output_writer is not None else None),
+                               (("decode",), decode_pipeline.in_flight if decode_pipeline is not None else None)],
+                      labelnames=["queue"])
+    register_filter_metrics(message_filter)
+    REGISTRY.callback("ais_output_records_total", "Record passati all'output, per esito.",
+                      lambda: [(("written",), output_writer.written), (("dropped",), output_writer.dropped)]
+                      if output_writer is not None else [], kind="counter", labelnames=["result"])
+    REGISTRY.callback("ais_vessels_tracked", "Navi nel registro in memoria.", lambda: len(vessel_registry))
+
+def log_decode_results(batch, vessel_registry, output_writer):
+    # Risultati restituiti dai worker della pipeline di decodifica
+    for result in batch:
+        if isinstance(result, DecodeError):
+            DECODE_ERRORS.labels(result.exception).inc()
+            if result.exception == "UnknownMessageException":
+                logger.warning(f"AVVISO: Messaggio NMEA assemblato ma non decodificabile come AIS: {result.raw_nmea} - {result.message}")
+            elif result.exception == "MissingMultipartMessageException":
+                logger.warning(f"AVVISO: Eccezione di frammentazione messaggio AIS: {result.message} - messaggio parziale: {result.raw_nmea}")
+            else:
+                logger.error(f"ERRORE durante la decodifica AIS del messaggio assemblato '{result.raw_nmea}': {result.exception}: {result.message}")
+        else:
+            DECODED_MESSAGES.labels(result["msg_type"]).inc()
+            vessel_registry.apply(result)
+            if output_writer is not None:
+                output_writer.write(result)
+            if DEBUG_MESSAGE_LOG:
+                logger.info(f"DECODED AIS (JSON): {json.dumps(result)}")
+
+def parse_moxa_port(moxa_port_str):
+    moxa_port = int(moxa_port_str)
+    if not (0 <= moxa_port <= 65535):
+        raise ValueError(f"La porta {moxa_port_str} non è valida. Deve essere tra 0 e 65535.")
+    return moxa_port
+
+def parse_moxa_port_or_exit(moxa_port_str):
+    # Modalità non interattiva: una porta non valida non si può richiedere, si esce con un errore leggibile
+    try:
+        return parse_moxa_port(moxa_port_str)
+    except ValueError as e:
+        logger.critical(f"Porta del Moxa non valida: {e}")
+        sys.exit(1)
 
 def read_and_parse_moxa_ais_stream_interactive():
     # Logica di input IP/Porta (resta come prima)
@@ -37,10 +101,7 @@ def read_and_parse_moxa_ais_stream_interactive():
     
     while True:
         try:
-            moxa_port_str = input("Inserisci la porta TCP del Moxa (es. 10001): ").strip()
-            moxa_port = int(moxa_port_str)
-            if not (0 <= moxa_port <= 65535):
-                raise ValueError(f"La porta {moxa_port_str} non è valida. Deve essere tra 0 e 65535.")
+            moxa_port = parse_moxa_port(input("Inserisci la porta TCP del Moxa (es. 10001): ").strip())
             break
         except ValueError as e:
             logger.error(f"Input non valido: {e}. Riprova.")
@@ -49,7 +110,29 @@ def read_and_parse_moxa_ais_stream_interactive():
             logger.critical("Si prega di avviare il container in modalità interattiva (es. docker run -it o oc rsh) o di fornire IP/Porta tramite variabili d'ambiente.")
             return
 
+    read_and_parse_moxa_ais_stream(moxa_ip, moxa_port)
+
+def read_and_parse_moxa_ais_stream(moxa_ip, moxa_port):
     sock = None
+    # Modalità pipeline (AIS_DECODE_WORKERS > 0): framing e assemblaggio qui, decodifica nei processi worker
+    decode_pipeline = DecodePipeline(workers=DECODE_WORKERS) if DECODE_WORKERS > 0 else None
+    # Stato corrente delle navi (posizione + dati statici), con rimozione di quelle non più sentite
+    vessel_registry = VesselRegistry()
+    # Posizioni troppo frequenti scartate prima della decodifica; con un solo Moxa non ci sono
+    # ricevitori sovrapposti, quindi niente deduplicazione salvo AIS_DEDUP_WINDOW esplicita
+    message_filter = MessageFilter(sources=1)
+    # Output strutturato (NDJSON o binario) scritto a batch da un thread dedicato
+    output_writer = AISOutputWriter(LOG_DIRECTORY) if OUTPUT_FORMAT != "none" else None
+    next_expire_at = time.monotonic() + VESSEL_EXPIRE_INTERVAL
+    # Serie delle metriche risolte una volta sola, fuori dal ciclo di lettura
+    source = f"{moxa_ip}:{moxa_port}"
+    bytes_received = BYTES_RECEIVED.labels(source)
+    sentences_received = SENTENCES_RECEIVED.labels(source)
+    non_nmea_lines = NON_NMEA_LINES.labels(source)
+    buffer_overflows = BUFFER_OVERFLOWS.labels(source)
+    framing_latency = STAGE_LATENCY.labels("framing")
+    assembly_latency = STAGE_LATENCY.labels("assembly")
+    decode_latency = STAGE_LATENCY.labels("decode")
     try:
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         sock.settimeout(5)
@@ -58,143 +141,106 @@ def read_and_parse_moxa_ais_stream_interactive():
         sock.connect((moxa_ip, moxa_port))
         logger.info("Connessione stabilita con successo!")
         logger.info(f"In attesa dello stream AIS. I log verranno scritti in {LOG_FILE_PATH}")
+        if output_writer is not None:
+            logger.info(f"I messaggi decodificati verranno scritti in {output_writer.path}")
+
+        # Framer a copia zero: riceve direttamente nel buffer e restituisce le sentenze complete
+        def on_overflow(dropped):
+            buffer_overflows.inc()
+            log_buffer_overflow(dropped)
 
-        received_buffer = b""
+        framer = NMEAFramer(on_overflow=on_overflow)
         
         # --- NUOVA INIZIALIZZAZIONE DELL'ASSEMBLER ---
         # Assembler per messaggi AIS multi-part
         # Timeout predefinito dell'assembler è 1 secondo, puoi cambiarlo se necessario.
         ais_assembler = NMEAMessageAssembler()
         # --- FINE NUOVA INIZIALIZZAZIONE ---
+        register_reader_metrics(source, ais_assembler, message_filter, vessel_registry, output_writer, decode_pipeline)
 
         while True:
-            data = sock.recv(BUFFER_SIZE)
-            if not data:
+            nbytes = framer.recv_into(sock)
+            if not nbytes:
                 logger.warning("Connessione chiusa dal Moxa.")
                 break
+            bytes_received.inc(nbytes)
 
-            received_buffer += data
+            started = time.perf_counter()
+            lines = list(framer.lines())
+            framing_latency.observe(time.perf_counter() - started)
 
-            while b'\r' in received_buffer or b'\n' in received_buffer:
-                cr_index = received_buffer.find(b'\r')
-                lf_index = received_buffer.find(b'\n')
+            nmea_sentences = 0
+            for raw_nmea_message_bytes in lines:
+                raw_nmea_message_str = str(raw_nmea_message_bytes, 'ascii', errors='ignore').strip()
+                        
+                if raw_nmea_message_str.startswith(('!', '$')):
+                    nmea_sentences += 1
+                    if DEBUG_MESSAGE_LOG:
+                        logger.info(f"RAW NMEA: {raw_nmea_message_str}") # Logga il messaggio RAW
 
-                delimiter_index = -1
-                if cr_index == -1 and lf_index == -1:
-                    delimiter_index = -1
-                elif cr_index == -1:
-                    delimiter_index = lf_index
-                elif lf_index == -1:
-                    delimiter_index = cr_index
-                else:
-                    delimiter_index = min(cr_index, lf_index)
+                    # --- MODIFICA QUI: USA L'ASSEMBLER ---
+                    try:
+                        # Aggiungi il frammento all'assembler
+                        started = time.perf_counter()
+                        assembled_message = ais_assembler.assemble(raw_nmea_message_str)
+                        assembly_latency.observe(time.perf_counter() - started)
 
-                if delimiter_index != -1:
-                    raw_nmea_message_bytes = received_buffer[:delimiter_index]
-                    received_buffer = received_buffer[delimiter_index + 1:]
+                        if assembled_message and not message_filter.accept(assembled_message):
+                            continue
+                        if assembled_message and decode_pipeline is not None:
+                            decode_pipeline.submit(assembled_message)
+                        elif assembled_message: # assembled_message sarà non-None solo quando un messaggio completo è pronto
+                            try:
+                                # Decodifica il messaggio AIS completo
+                                started = time.perf_counter()
+                                log_data = decode_log_data(assembled_message)
 
-                    if raw_nmea_message_bytes.endswith(b'\r') and received_buffer.startswith(b'\n'):
-                        received_buffer = received_buffer[1:]
+                                if log_data is not None:
+                                    decode_latency.observe(time.perf_counter() - started)
+                                    DECODED_MESSAGES.labels(log_data["msg_type"]).inc()
+                                    vessel_registry.apply(log_data)
+                                    if output_writer is not None:
+                                        output_writer.write(log_data)
 
-                    if raw_nmea_message_bytes:
-                        raw_nmea_message_str = raw_nmea_message_bytes.decode('ascii', errors='ignore').strip()
-                        
-                        if raw_nmea_message_str.startswith(('!', '$')):
-                            logger.info(f"RAW NMEA: {raw_nmea_message_str}") # Logga il messaggio RAW
+                                    if DEBUG_MESSAGE_LOG:
+                                        logger.info("\n--- Messaggio AIS Decodificato ---")
+                                        logger.info(f"DECODED AIS (JSON): {json.dumps(log_data)}")
+                                            
+                                else:
+                                    DECODE_ERRORS.labels("EmptyDecode").inc()
+                                    logger.warning(f"AVVISO: Nessun oggetto decodificato da pyais per messaggio completo: {assembled_message}")
 
-                            # --- MODIFICA QUI: USA L'ASSEMBLER ---
-                            try:
-                                # Aggiungi il frammento all'assembler
-                                assembled_message = ais_assembler.assemble(raw_nmea_message_str)
+                            except UnknownMessageException as e:
+                                DECODE_ERRORS.labels("UnknownMessageException").inc()
+                                logger.warning(f"AVVISO: Messaggio NMEA assemblato ma non decodificabile come AIS: {assembled_message} - {e}")
+                            except MissingMultipartMessageException as e: # <--- CATTURA QUESTA ECCEZIONE QUI
+                                DECODE_ERRORS.labels("MissingMultipartMessageException").inc()
+                                # Questo accade se l'assembler rilascia un messaggio non completo a causa di timeout interni
+                                logger.warning(f"AVVISO: Eccezione di frammentazione messaggio AIS: {e} - messaggio parziale: {assembled_message}")
+                            except Exception as e:
+                                DECODE_ERRORS.labels(type(e).__name__).inc()
+                                logger.error(f"ERRORE durante la decodifica AIS del messaggio assemblato '{assembled_message}': {e}", exc_info=True)
 
-                                if assembled_message: # assembled_message sarà non-None solo quando un messaggio completo è pronto
-                                    try:
-                                        # Decodifica il messaggio AIS completo
-                                        decoded_ais_message = decode(assembled_message)
+                    except Exception as e: # Questo catch è per errori nell'assembler stesso o NMEA non valido
+                        logger.error(f"ERRORE durante l'assemblaggio del messaggio NMEA '{raw_nmea_message_str}': {e}", exc_info=True)
 
-                                        if decoded_ais_message:
-                                            logger.info("\n--- Messaggio AIS Decodificato ---")
-                                            
-                                            log_data = {
-                                                "timestamp": time.time(),
-                                                "raw_nmea": assembled_message, # Logga il messaggio completo assemblato
-                                                "msg_type": decoded_ais_message.msg_type,
-                                                "mmsi": getattr(decoded_ais_message, 'mmsi', 'N/A'),
-                                                "decoded_fields": {}
-                                            }
-
-                                            # Logica di estrazione campi (resta come prima)
-                                            if decoded_ais_message.msg_type in [1, 2, 3]:
-                                                log_data["decoded_fields"] = {
-                                                    "status": getattr(decoded_ais_message, 'status', 'N/A'),
-                                                    "lat": getattr(decoded_ais_message, 'lat', 'N/A'),
-                                                    "lon": getattr(decoded_ais_message, 'lon', 'N/A'),
-                                                    "speed": getattr(decoded_ais_message, 'speed', 'N/A'),
-                                                    "course": getattr(decoded_ais_message, 'course', 'N/A'),
-                                                    "heading": getattr(decoded_ais_message, 'heading', 'N/A')
-                                                }
-                                            elif decoded_ais_message.msg_type == 5:
-                                                log_data["decoded_fields"] = {
-                                                    "shipname": getattr(decoded_ais_message, 'shipname', 'N/A'),
-                                                    "ship_type": getattr(decoded_ais_message, 'ship_type', 'N/A'),
-                                                    "callsign": getattr(decoded_ais_message, 'callsign', 'N/A'),
-                                                    "imo": getattr(decoded_ais_message, 'imo', 'N/A'),
-                                                    "dimensions": {
-                                                        "to_bow": getattr(decoded_ais_message, 'to_bow', 'N/A'),
-                                                        "to_stern": getattr(decoded_ais_message, 'to_stern', 'N/A'),
-                                                        "to_port": getattr(decoded_ais_message, 'to_port', 'N/A'),
-                                                        "to_starboard": getattr(decoded_ais_message, 'to_starboard', 'N/A')
-                                                    }
-                                                }
-                                            elif decoded_ais_message.msg_type == 18:
-                                                log_data["decoded_fields"] = {
-                                                    "lat": getattr(decoded_ais_message, 'lat', 'N/A'),
-                                                    "lon": getattr(decoded_ais_message, 'lon', 'N/A'),
-                                                    "speed": getattr(decoded_ais_message, 'speed', 'N/A'),
-                                                    "course": getattr(decoded_ais_message, 'course', 'N/A'),
-                                                    "unit": getattr(decoded_ais_message, 'unit', 'N/A')
-                                                }
-                                            elif decoded_ais_message.msg_type == 24:
-                                                log_data["decoded_fields"]["part_num"] = getattr(decoded_ais_message, 'part_num', 'N/A')
-                                                if hasattr(decoded_ais_message, 'shipname'):
-                                                    log_data["decoded_fields"]["shipname"] = decoded_ais_message.shipname
-                                                if hasattr(decoded_ais_message, 'ship_type'):
-                                                    log_data["decoded_fields"]["ship_type"] = decoded_ais_message.ship_type
-                                                if hasattr(decoded_ais_message, 'callsign'):
-                                                    log_data["decoded_fields"]["callsign"] = decoded_ais_message.callsign
-                                            else:
-                                                log_data["decoded_fields"] = decoded_ais_message.to_dict()
-                                                log_data["decoded_fields"].pop('msg_type', None)
-                                                log_data["decoded_fields"].pop('mmsi', None)
-
-                                            logger.info(f"DECODED AIS (JSON): {json.dumps(log_data)}")
-                                            
-                                        else:
-                                            logger.warning(f"AVVISO: Nessun oggetto decodificato da pyais per messaggio completo: {assembled_message}")
-
-                                    except UnknownMessageException as e:
-                                        logger.warning(f"AVVISO: Messaggio NMEA assemblato ma non decodificabile come AIS: {assembled_message} - {e}")
-                                    except MissingMultipartMessageException as e: # <--- CATTURA QUESTA ECCEZIONE QUI
-                                        # Questo accade se l'assembler rilascia un messaggio non completo a causa di timeout interni
-                                        logger.warning(f"AVVISO: Eccezione di frammentazione messaggio AIS: {e} - messaggio parziale: {assembled_message}")
-                                    except Exception as e:
-                                        logger.error(f"ERRORE durante la decodifica AIS del messaggio assemblato '{assembled_message}': {e}", exc_info=True)
-
-                            except Exception as e: # Questo catch è per errori nell'assembler stesso o NMEA non valido
-                                logger.error(f"ERRORE durante l'assemblaggio del messaggio NMEA '{raw_nmea_message_str}': {e}", exc_info=True)
-
-                        else:
-                            logger.debug(f"RAW non NMEA: {raw_nmea_message_str}")
                 else:
-                    break
-            
-            if len(received_buffer) > BUFFER_SIZE * 4:
-                logger.warning(f"ATTENZIONE: Buffer dati in crescita ({len(received_buffer)} bytes) senza delimitatori. Svuotamento parziale.")
-                try:
-                    logger.warning(f"Contenuto parziale del buffer (inizio): {received_buffer[:100].decode('ascii', errors='replace')}...")
-                except:
-                    logger.warning(f"Contenuto parziale del buffer (inizio, binario): {received_buffer[:100]}...")
-                received_buffer = b""
+                    non_nmea_lines.inc()
+                    logger.debug(f"RAW non NMEA: {raw_nmea_message_str}")
+
+            sentences_received.inc(nmea_sentences)
+
+            if decode_pipeline is not None:
+                decode_pipeline.flush(stale_only=True)
+                for batch in decode_pipeline.poll():
+                    log_decode_results(batch, vessel_registry, output_writer)
+
+            if time.monotonic() >= next_expire_at:
+                removed = vessel_registry.expire()
+                logger.info(f"Navi tracciate: {len(vessel_registry)} (rimosse per inattività: {removed})")
+                message_filter.expire()
+                logger.info(f"Filtro messaggi: {message_filter.stats()}")
+                next_expire_at = time.monotonic() + VESSEL_EXPIRE_INTERVAL
 
     except ConnectionRefusedError:
         logger.error(f"Errore: Connessione rifiutata da {moxa_ip}:{moxa_port}.")
@@ -205,9 +251,24 @@ def read_and_parse_moxa_ais_stream_interactive():
     except Exception as e:
         logger.critical(f"Si è verificato un errore critico inatteso: {e}", exc_info=True)
     finally:
+        if decode_pipeline is not None:
+            for batch in decode_pipeline.close():
+                log_decode_results(batch, vessel_registry, output_writer)
+        logger.info(f"Filtro messaggi: {message_filter.stats()}")
+        if output_writer is not None:
+            output_writer.close()
+            logger.info(f"Output chiuso: {output_writer.written} record scritti, {output_writer.dropped} scartati.")
         if sock:
             sock.close()
             logger.info("Socket chiuso.")
 
 if __name__ == "__main__":
-    read_and_parse_moxa_ais_stream_interactive()
\ No newline at end of file
+    # Endpoint /metrics per lo scrape (AIS_METRICS_PORT, 0 = disattivato)
+    start_metrics_server()
+    # Modalità non interattiva: `python test_ok.py IP PORTA` oppure variabili d'ambiente MOXA_IP / MOXA_PORT
+    if len(sys.argv) == 3:
+        read_and_parse_moxa_ais_stream(sys.argv[1], parse_moxa_port_or_exit(sys.argv[2]))
+    elif os.environ.get("MOXA_IP") and os.environ.get("MOXA_PORT"):
+        read_and_parse_moxa_ais_stream(os.environ["MOXA_IP"], parse_moxa_port_or_exit(os.environ["MOXA_PORT"]))
+    else:
+        read_and_parse_moxa_ais_stream_interactive()
@@ -0,0 +1,65 @@
+import pytest
+from pyais.encode import encode_dict
+
+from ais_dedup import (MessageFilter, PositionThinner, THIN_STATE_MAX_AGE, default_dedup_window, message_payload,
+                       position_from_payload)
+
+
+def _position(mmsi, lat, lon, channel="A"):
+    sentence = encode_dict({"type": 1, "mmsi": mmsi, "lat": lat, "lon": lon}, sentence_type="VDM")[0]
+    return sentence.replace(",A,", f",{channel},", 1)
+
+
+def _payload(mmsi, lat, lon):
+    return message_payload(_position(mmsi, lat, lon))
+
+
+def test_position_from_payload():
+    mmsi, lat, lon = position_from_payload(_payload(247000001, 44.1234, -12.5))
+    assert mmsi == 247000001
+    assert lat == pytest.approx(44.1234, abs=1e-5)
+    assert lon == pytest.approx(-12.5, abs=1e-5)
+    assert position_from_payload(_payload(247000001, 91, 181))[1:] == (None, None)
+
+
+def test_dedup_only_across_sources_by_default():
+    assert default_dedup_window(1) == 0
+    assert default_dedup_window(3) > 0
+    assert MessageFilter().dedup is None
+    message_filter = MessageFilter(sources=2)
+    assert message_filter.accept(_position(1, 45.0, 12.0, "A"), now=0.0)
+    # Stesso payload da un altro ricevitore, con intestazione diversa
+    assert not message_filter.accept(_position(1, 45.0, 12.0, "B"), now=1.0)
+    assert message_filter.accept(_position(1, 45.0, 12.0, "A"), now=10.0)
+
+
+def test_thinning_by_interval_and_distance():
+    thinner = PositionThinner(min_interval=30, min_distance=100)
+    assert not thinner.should_drop(_payload(1, 45.0, 12.0), 0.0)
+    assert thinner.should_drop(_payload(1, 45.0001, 12.0), 10.0)       # ~11 m
+    assert not thinner.should_drop(_payload(1, 45.002, 12.0), 20.0)    # ~220 m
+    assert not thinner.should_drop(_payload(1, 45.002, 12.0), 51.0)    # intervallo trascorso
+    assert thinner.thinned == 1
+
+
+def test_thinning_by_distance_only():
+    message_filter = MessageFilter(dedup_window=0, thin_interval=0, thin_distance=100)
+    assert message_filter.thinner is not None
+    thinner = message_filter.thinner
+    assert not thinner.should_drop(_payload(1, 91, 181), 0.0)          # posizione non disponibile
+    assert not thinner.should_drop(_payload(1, 45.0, 12.0), 1.0)       # prima posizione valida
+    assert thinner.should_drop(_payload(1, 45.0005, 12.0), 500.0)      # ~55 m, anche dopo molto tempo
+    assert thinner.should_drop(_payload(1, 91, 181), 600.0)
+    assert not thinner.should_drop(_payload(1, 45.001, 12.0), 700.0)   # ~110 m
+    # Una nave ferma passa di nuovo dopo THIN_STATE_MAX_AGE, e il suo stato scade con expire()
+    assert not thinner.should_drop(_payload(1, 45.001, 12.0), 700.0 + THIN_STATE_MAX_AGE)
+    thinner.expire(701.0 + 2 * THIN_STATE_MAX_AGE)
+    assert len(thinner) == 0
+
+
+def test_non_position_messages_pass():
+    thinner = PositionThinner(min_interval=30)
+    static = message_payload(encode_dict({"type": 5, "mmsi": 1, "shipname": "TEST"}, sentence_type="VDM"))
+    assert not thinner.should_drop(static, 0.0)
+    assert not thinner.should_drop(static, 1.0)
+    assert thinner.checked == 0
@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from ais_output import AISOutputWriter, BinaryColumnarFormat, read_binary_records
+
+
+RECORDS = [
+    {"timestamp": 1700000000.123456, "raw_nmea": "!AIVDM,1,1,,A,13u?etPv2;0n:dDPwUM1U1Cb069D,0*23", "msg_type": 1,
+     "mmsi": 265547250, "decoded_fields": {"status": 0, "lat": 57.660353, "lon": 179.1234566, "speed": 12.3,
+                                           "course": 359.9, "heading": 511}, "source_id": "moxa-1"},
+    # Posizione non disponibile e velocità intera: restano nel JSON, con le chiavi originali
+    {"timestamp": 1700000001.5, "raw_nmea": ["!AIVDM,2,1,3,B,...,0*00", "!AIVDM,2,2,3,B,...,2*00"], "msg_type": 18,
+     "mmsi": 1, "decoded_fields": {"lat": None, "lon": None, "speed": 0, "heading": 12}},
+    {"timestamp": 1700000002.0, "raw_nmea": "!AIVDM,1,1,,A,E>jHC=c6:W2h22R`@1:WdP00000,4*3E", "msg_type": 21,
+     "mmsi": 992351000, "decoded_fields": {}},
+    # Record incompleti (es. costruiti a mano): nessuna chiave inventata, nessun valore perso
+    {"raw_nmea": "!AIVDM,...", "msg_type": None, "mmsi": "N/A"},
+    {"timestamp": 3, "msg_type": 300, "mmsi": -1, "decoded_fields": None},
+]
+
+
+def test_binary_round_trip(tmp_path):
+    path = tmp_path / "out.aisb"
+    path.write_bytes(BinaryColumnarFormat.encode(RECORDS[:2]) + BinaryColumnarFormat.encode(RECORDS[2:]))
+    assert list(read_binary_records(str(path))) == RECORDS
+
+
+def test_binary_rejects_unknown_version(tmp_path):
+    path = tmp_path / "out.aisb"
+    data = bytearray(BinaryColumnarFormat.encode(RECORDS[:1]))
+    data[4] = BinaryColumnarFormat.VERSION + 1
+    path.write_bytes(bytes(data))
+    with pytest.raises(ValueError):
+        list(read_binary_records(str(path)))
+
+
+@pytest.mark.parametrize("output_format", ["ndjson", "binary"])
+def test_writer_round_trip(tmp_path, output_format):
+    writer = AISOutputWriter(str(tmp_path), output_format=output_format, compress=False, max_age=0)
+    for record in RECORDS[:3]:
+        writer.write(record)
+    writer.close()
+    assert writer.written == 3
+    if output_format == "binary":
+        records = list(read_binary_records(writer.path))
+    else:
+        with open(writer.path, "rb") as output:
+            records = [json.loads(line) for line in output]
+    assert records == RECORDS[:3]
@@ -0,0 +1,26 @@
+import json
+
+import pytest
+
+from ais_websocket_bridge import Subscriber, SubscriptionFilter, SubscriptionIndex
+
+
+@pytest.mark.parametrize("request_text", [
+    '{"bbox": [NaN, 43.0, 11.0, 44.5]}',
+    '{"bbox": [-1e400, 43.0, 11.0, 44.5]}',
+    '{"bbox": [8.5, 43.0, Infinity, 44.5]}',
+    '{"msg_types": [1e400]}',
+    '{"mmsi": [NaN]}',
+])
+def test_non_finite_values_rejected(request_text):
+    with pytest.raises(ValueError):
+        SubscriptionFilter.from_request(json.loads(request_text))
+
+
+def test_index_matches_bbox_subscription():
+    subscriber = Subscriber(websocket=None)
+    subscriber.filter = SubscriptionFilter.from_request(json.loads('{"bbox": [8.5, 43.0, 11.0, 44.5]}'))
+    index = SubscriptionIndex()
+    index.add(subscriber)
+    assert index.match(1, 247123456, 44.0, 10.0) == [subscriber]
+    assert index.match(1, 247123456, 45.0, 10.0) == []
@@ -0,0 +1,63 @@
+import pytest
+
+from nmea_framer import NMEAFramer
+
+
+def _sentences(count):
+    return [b"!AIVDM,1,1,,A,%04d,0*00" % index for index in range(count)]
+
+
+def _stream(sentences):
+    return b"".join(sentence + b"\r\n" for sentence in sentences)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 50, 64, 200, 10000])
+def test_feed_chunk_sizes(chunk_size):
+    sentences = _sentences(40)
+    data = _stream(sentences)
+    framer = NMEAFramer(buffer_size=64, max_line_length=32)
+    lines = []
+    for offset in range(0, len(data), chunk_size):
+        lines.extend(bytes(line) for line in framer.feed(data[offset:offset + chunk_size]))
+    assert lines == sentences
+    assert framer.pending == 0
+    assert framer.overflow_count == 0
+
+
+def test_feed_larger_than_free_space_returns_stable_lines():
+    # Più grande dell'intero buffer: la compattazione durante la copia non deve alterare le righe già estratte
+    sentences = _sentences(20)
+    framer = NMEAFramer(buffer_size=64, max_line_length=32)
+    framer.feed(b"!AIVDM,1,1")
+    lines = framer.feed(b",,A,head,0*00\r\n" + _stream(sentences))
+    assert [bytes(line) for line in lines] == [b"!AIVDM,1,1,,A,head,0*00"] + sentences
+
+
+def test_feed_is_eager():
+    # Le righe vengono estratte anche se il risultato di feed() non viene letto
+    framer = NMEAFramer(buffer_size=64, max_line_length=32)
+    framer.feed(_stream(_sentences(10)))
+    framer.feed(b"!A,1\r\n!A,2\r\n!A")
+    assert framer.lines_framed == 12
+    assert framer.feed(b",3") == []
+    assert [bytes(line) for line in framer.feed(b"\n")] == [b"!A,3"]
+
+
+def test_lines_left_by_recv_are_not_skipped():
+    # Dati ricevuti con get_buffer()/buffer_updated() senza lines(): un feed() senza delimitatori non li salta
+    framer = NMEAFramer(buffer_size=64, max_line_length=32)
+    data = b"!A,1\r\n!A,2"
+    framer.get_buffer()[:len(data)] = data
+    framer.buffer_updated(len(data))
+    assert [bytes(line) for line in framer.feed(b",x")] == [b"!A,1"]
+    assert [bytes(line) for line in framer.feed(b"\r\n")] == [b"!A,2,x"]
+
+
+def test_overflow_discards_until_next_delimiter():
+    dropped = []
+    framer = NMEAFramer(buffer_size=64, max_line_length=32, on_overflow=lambda view: dropped.append(bytes(view)))
+    assert framer.feed(b"x" * 40) == []
+    assert framer.overflow_count == 1
+    assert dropped == [b"x" * 40]
+    assert [bytes(line) for line in framer.feed(b"yyy\r\n!A,1\r\n")] == [b"!A,1"]
+    assert framer.discarded_bytes == 43
@@ -0,0 +1,68 @@
+import random
+
+import pytest
+
+from vessel_registry import VesselRegistry, haversine_m
+
+
+def _fleet(vessels=3000, seed=3):
+    rng = random.Random(seed)
+    registry = VesselRegistry()
+    for mmsi in range(1, vessels + 1):
+        registry.update_position(mmsi, rng.uniform(30.0, 46.0), rng.uniform(-6.0, 36.0), timestamp=0.0)
+    return registry
+
+
+def _brute_force(registry, lat, lon, count):
+    distances = []
+    for mmsi in range(1, len(registry) + 1):
+        vessel_lat, vessel_lon = registry.position(mmsi)
+        distances.append((haversine_m(lat, lon, vessel_lat, vessel_lon), mmsi))
+    return sorted(distances)[:count]
+
+
+@pytest.mark.parametrize("lat, lon", [(40.0, 10.0), (44.5, 35.9), (0.0, -30.0), (-60.0, 150.0), (-5.9, -102.8),
+                                      (89.0, 0.0), (38.0, -179.99)])
+def test_nearest_matches_brute_force(lat, lon):
+    registry = _fleet()
+    found = registry.nearest(lat, lon, 10)
+    expected = _brute_force(registry, lat, lon, 10)
+    assert [mmsi for _, mmsi in found] == [mmsi for _, mmsi in expected]
+    assert [distance for distance, _ in found] == pytest.approx([distance for distance, _ in expected])
+
+
+def test_nearest_max_radius():
+    registry = _fleet()
+    assert registry.nearest(0.0, -30.0, 10, max_radius_m=1000000) == []
+    expected = [item for item in _brute_force(registry, 40.0, 10.0, 10) if item[0] <= 20000]
+    assert registry.nearest(40.0, 10.0, 10, max_radius_m=20000) == pytest.approx(expected)
+
+
+def test_queries_across_antimeridian():
+    registry = VesselRegistry()
+    registry.update_position(1, 0.0, -179.95, timestamp=0.0)
+    registry.update_position(2, 0.0, 179.9, timestamp=0.0)
+    registry.update_position(3, 0.0, 170.0, timestamp=0.0)
+    assert [mmsi for _, mmsi in registry.radius(0.0, 179.99, 20000)] == [1, 2]
+    assert [mmsi for _, mmsi in registry.radius(0.0, -179.99, 20000)] == [1, 2]
+    assert [mmsi for _, mmsi in registry.nearest(0.0, 179.99, 2)] == [1, 2]
+    registry.update_position(4, 10.0, 180.0, timestamp=0.0)
+    assert registry.bbox(179.5, 9.5, 180.0, 10.5) == [4]
+
+
+def test_index_follows_moves_and_expiry():
+    registry = VesselRegistry(ttl=60)
+    registry.update_position(1, 45.0, 12.0, timestamp=0.0)
+    registry.update_position(2, 45.05, 12.05, timestamp=100.0)
+    assert sorted(registry.bbox(11.9, 44.9, 12.1, 45.1)) == [1, 2]
+    # Spostamento lontano: la nave lascia la cella e i nodi dei livelli superiori
+    registry.update_position(1, -33.9, 151.2, timestamp=100.0)
+    assert registry.bbox(11.9, 44.9, 12.1, 45.1) == [2]
+    assert [mmsi for _, mmsi in registry.nearest(-34.0, 151.0, 1)] == [1]
+    registry.update_position(1, 45.0, 12.0, timestamp=0.0)
+    assert registry.expire(now=100.0) == 1
+    assert registry.get(1) is None
+    assert [mmsi for _, mmsi in registry.nearest(-34.0, 151.0, 5)] == [2]
+    assert registry.expire(now=1000.0) == 1
+    assert registry.nearest(45.0, 12.0) == []
+    assert not registry._grid and not any(registry._levels)
@@ -0,0 +1,568 @@
+import heapq
+import math
+import time
+from array import array
+
+
+# --- CONFIGURAZIONE DEL REGISTRO NAVI ---
+VESSEL_TTL = 600            # secondi senza messaggi prima di rimuovere una nave
+GRID_CELL_DEGREES = 0.1     # lato delle celle dell'indice spaziale (~11 km in latitudine)
+EXPIRY_BUCKET_SECONDS = 10  # granularità dell'indice di scadenza
+# Livelli superiori dell'indice spaziale: ogni nodo raggruppa GRID_BRANCH x GRID_BRANCH nodi del livello sotto
+GRID_BRANCH = 4
+# Anelli di celle visitati da nearest() attorno al punto prima di passare ai livelli superiori
+NEAREST_MAX_RING = 5
+INITIAL_CAPACITY = 1024
+
+POSITION_TYPES = frozenset((1, 2, 3, 18))
+STATIC_TYPES = frozenset((5, 24))
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180.0
+NaN = float("nan")
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _number(value):
+    # I campi possono mancare (None), valere 'N/A' (record dei vecchi log) o essere enum di pyais
+    if value is None or value == 'N/A':
+        return None
+    return value
+
+
+class VesselRegistry:
+    """Stato corrente delle navi, indicizzato per MMSI e per posizione.
+
+    I record sono "slot" in array paralleli (``array`` a tipo fisso), non
+    dict per nave: un MMSI corrisponde a un indice di slot e gli
+    aggiornamenti sono O(1). Le posizioni sono indicizzate su una griglia
+    regolare aggiornata incrementalmente solo quando la nave cambia cella.
+    Le navi non più sentite da ``ttl`` secondi vengono rimosse da
+    ``expire()``, che visita solo i bucket di scadenza più vecchi.
+    """
+
+    def __init__(self, ttl=VESSEL_TTL, cell_size=GRID_CELL_DEGREES, capacity=INITIAL_CAPACITY):
+        self.ttl = ttl
+        self.cell_size = cell_size
+        self._slots = {}        # mmsi -> slot
+        self._free = []         # slot liberati dalle rimozioni, riutilizzati per primi
+        self._capacity = 0
+
+        # Campi dinamici
+        self._mmsi = array('q')
+        self._lat = array('d')
+        self._lon = array('d')
+        self._speed = array('f')
+        self._course = array('f')
+        self._heading = array('h')
+        self._status = array('b')
+        self._msg_type = array('B')
+        self._last_seen = array('d')
+        self._position_at = array('d')
+        # Campi statici (tipi 5 e 24)
+        self._shipname = []
+        self._callsign = []
+        self._ship_type = array('h')
+        self._imo = array('l')
+        self._to_bow = array('H')
+        self._to_stern = array('H')
+        self._to_port = array('H')
+        self._to_starboard = array('H')
+
+        # Indice spaziale: cella -> insieme di slot; per slot la cella corrente
+        self._grid = {}
+        self._cell = []
+        # Livelli superiori (per nearest): in _levels[0] ogni nodo copre GRID_BRANCH x GRID_BRANCH celle,
+        # in _levels[i] altrettanti nodi di _levels[i - 1]. Nodo -> {riga: colonne} dei figli occupati;
+        # l'ultimo livello ha al più una sessantina di nodi
+        self._levels = []
+        # Le colonne si avvolgono all'antimeridiano: la cella di lon 180 è quella di lon -180
+        self._columns = math.ceil(360.0 / cell_size)
+        rows, cols = math.ceil(180.0 / cell_size), self._columns
+        while rows * cols > 64:
+            rows, cols = -(-rows // GRID_BRANCH), -(-cols // GRID_BRANCH)
+            self._levels.append({})
+        # (livello, riga) -> latitudini, seni e coseni dei bordi della riga, per le distanze minime dei nodi
+        self._row_bounds = {}
+        # Indice di scadenza: bucket temporale -> insieme di slot; per slot il bucket corrente
+        self._expiry = {}
+        self._expiry_bucket = array('q')
+
+        # Statistiche
+        self.updates = 0
+        self.evicted = 0
+
+        self._grow(capacity)
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, mmsi):
+        return mmsi in self._slots
+
+    def _grow(self, capacity):
+        extra = capacity - self._capacity
+        for column, value in ((self._mmsi, 0), (self._lat, NaN), (self._lon, NaN), (self._speed, NaN),
+                              (self._course, NaN), (self._heading, -1), (self._status, -1), (self._msg_type, 0),
+                              (self._last_seen, 0.0), (self._position_at, 0.0), (self._ship_type, -1),
+                              (self._imo, 0), (self._to_bow, 0), (self._to_stern, 0), (self._to_port, 0),
+                              (self._to_starboard, 0), (self._expiry_bucket, -1)):
+            column.extend(array(column.typecode, [value]) * extra)
+        self._shipname.extend([None] * extra)
+        self._callsign.extend([None] * extra)
+        self._cell.extend([None] * extra)
+        # Gli slot nuovi vengono usati in ordine crescente
+        self._free.extend(range(capacity - 1, self._capacity - 1, -1))
+        self._capacity = capacity
+
+    def _allocate(self, mmsi):
+        if not self._free:
+            self._grow(self._capacity * 2)
+        slot = self._free.pop()
+        self._slots[mmsi] = slot
+        self._mmsi[slot] = mmsi
+        return slot
+
+    def _release(self, slot):
+        del self._slots[self._mmsi[slot]]
+        cell = self._cell[slot]
+        if cell is not None:
+            self._grid_discard(cell, slot)
+            self._cell[slot] = None
+        self._lat[slot] = self._lon[slot] = self._speed[slot] = self._course[slot] = NaN
+        self._heading[slot] = self._status[slot] = self._ship_type[slot] = -1
+        self._imo[slot] = self._to_bow[slot] = self._to_stern[slot] = self._to_port[slot] = self._to_starboard[slot] = 0
+        self._shipname[slot] = self._callsign[slot] = None
+        self._expiry_bucket[slot] = -1
+        self._free.append(slot)
+
+    def _grid_add(self, cell, slot):
+        slots = self._grid.get(cell)
+        if slots is None:
+            slots = self._grid[cell] = set()
+            # Prima nave nella cella: si risale finché il nodo padre esiste già
+            row, col = cell
+            for level in self._levels:
+                parent = (row // GRID_BRANCH, col // GRID_BRANCH)
+                children = level.get(parent)
+                if children is not None:
+                    columns = children.get(row)
+                    if columns is None:
+                        children[row] = {col}
+                    else:
+                        columns.add(col)
+                    break
+                level[parent] = {row: {col}}
+                row, col = parent
+        slots.add(slot)
+
+    def _grid_discard(self, cell, slot):
+        slots = self._grid[cell]
+        slots.discard(slot)
+        if slots:
+            return
+        del self._grid[cell]
+        row, col = cell
+        for level in self._levels:
+            parent = (row // GRID_BRANCH, col // GRID_BRANCH)
+            children = level[parent]
+            columns = children[row]
+            columns.discard(col)
+            if columns:
+                break
+            del children[row]
+            if children:
+                break
+            del level[parent]
+            row, col = parent
+
+    @staticmethod
+    def _discard(index, key, slot):
+        bucket = index[key]
+        bucket.discard(slot)
+        if not bucket:
+            del index[key]
+
+    def _cell_of(self, lat, lon):
+        return int((lat + 90.0) // self.cell_size), int((lon + 180.0) // self.cell_size) % self._columns
+
+    def _touch(self, slot, timestamp):
+        self._last_seen[slot] = timestamp
+        bucket = int(timestamp // EXPIRY_BUCKET_SECONDS)
+        previous = self._expiry_bucket[slot]
+        if previous != bucket:
+            if previous >= 0:
+                self._discard(self._expiry, previous, slot)
+            self._expiry.setdefault(bucket, set()).add(slot)
+            self._expiry_bucket[slot] = bucket
+
+    def update_position(self, mmsi, lat, lon, speed=None, course=None, heading=None, status=None,
+                        msg_type=1, timestamp=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        slot = self._slots.get(mmsi)
+        if slot is None:
+            slot = self._allocate(mmsi)
+        self.updates += 1
+        self._msg_type[slot] = msg_type
+        self._touch(slot, timestamp)
+        # pyais usa 91/181 per "posizione non disponibile"
+        if lat is not None and lon is not None and -90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0:
+            self._lat[slot] = lat
+            self._lon[slot] = lon
+            self._position_at[slot] = timestamp
+            cell = self._cell_of(lat, lon)
+            previous = self._cell[slot]
+            if cell != previous:
+                if previous is not None:
+                    self._grid_discard(previous, slot)
+                self._grid_add(cell, slot)
+                self._cell[slot] = cell
+        if speed is not None:
+            self._speed[slot] = speed
+        if course is not None:
+            self._course[slot] = course
+        if heading is not None:
+            self._heading[slot] = heading
+        if status is not None:
+            self._status[slot] = status
+        return slot
+
+    def update_static(self, mmsi, shipname=None, callsign=None, ship_type=None, imo=None,
+                      to_bow=None, to_stern=None, to_port=None, to_starboard=None, timestamp=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        slot = self._slots.get(mmsi)
+        if slot is None:
+            slot = self._allocate(mmsi)
+        self.updates += 1
+        self._touch(slot, timestamp)
+        if shipname is not None:
+            self._shipname[slot] = shipname
+        if callsign is not None:
+            self._callsign[slot] = callsign
+        if ship_type is not None:
+            self._ship_type[slot] = ship_type
+        if imo is not None:
+            self._imo[slot] = imo
+        if to_bow is not None:
+            self._to_bow[slot] = to_bow
+            self._to_stern[slot] = to_stern or 0
+            self._to_port[slot] = to_port or 0
+            self._to_starboard[slot] = to_starboard or 0
+        return slot
+
+    def apply(self, log_data):
+        """Aggiorna il registro da un record prodotto da ``build_log_data``. Restituisce False se ignorato."""
+        msg_type = log_data.get("msg_type")
+        mmsi = log_data.get("mmsi")
+        if not isinstance(mmsi, int):
+            return False
+        fields = log_data.get("decoded_fields") or {}
+        timestamp = log_data.get("timestamp")
+        if msg_type in POSITION_TYPES:
+            speed = _number(fields.get("speed"))
+            course = _number(fields.get("course"))
+            heading = _number(fields.get("heading"))
+            status = _number(fields.get("status"))
+            self.update_position(mmsi, _number(fields.get("lat")), _number(fields.get("lon")),
+                                 speed=speed, course=course,
+                                 heading=int(heading) if heading is not None else None,
+                                 status=int(status) if status is not None else None,
+                                 msg_type=msg_type, timestamp=timestamp)
+            return True
+        if msg_type in STATIC_TYPES:
+            dimensions = fields.get("dimensions") or fields
+            ship_type = _number(fields.get("ship_type"))
+            imo = _number(fields.get("imo"))
+            self.update_static(mmsi, shipname=_number(fields.get("shipname")),
+                               callsign=_number(fields.get("callsign")),
+                               ship_type=int(ship_type) if ship_type is not None else None,
+                               imo=int(imo) if imo is not None else None,
+                               to_bow=_number(dimensions.get("to_bow")), to_stern=_number(dimensions.get("to_stern")),
+                               to_port=_number(dimensions.get("to_port")),
+                               to_starboard=_number(dimensions.get("to_starboard")),
+                               timestamp=timestamp)
+            return True
+        return False
+
+    def expire(self, now=None):
+        """Rimuove le navi non sentite da più di ``ttl`` secondi. Restituisce quante ne ha rimosse."""
+        now = time.time() if now is None else now
+        cutoff = now - self.ttl
+        cutoff_bucket = int(cutoff // EXPIRY_BUCKET_SECONDS)
+        removed = 0
+        for bucket in [bucket for bucket in self._expiry if bucket <= cutoff_bucket]:
+            slots = self._expiry[bucket]
+            for slot in list(slots):
+                # Il bucket di confine può contenere navi sentite dopo il cutoff
+                if self._last_seen[slot] < cutoff:
+                    slots.discard(slot)
+                    self._release(slot)
+                    removed += 1
+            if not slots:
+                del self._expiry[bucket]
+        self.evicted += removed
+        return removed
+
+    def get(self, mmsi):
+        """Stato corrente di una nave come dict, o None se sconosciuta."""
+        slot = self._slots.get(mmsi)
+        if slot is None:
+            return None
+        lat = self._lat[slot]
+        return {
+            "mmsi": mmsi,
+            "msg_type": self._msg_type[slot],
+            "lat": None if math.isnan(lat) else lat,
+            "lon": None if math.isnan(lat) else self._lon[slot],
+            "speed": None if math.isnan(self._speed[slot]) else round(self._speed[slot], 1),
+            "course": None if math.isnan(self._course[slot]) else round(self._course[slot], 1),
+            "heading": None if self._heading[slot] < 0 else self._heading[slot],
+            "status": None if self._status[slot] < 0 else self._status[slot],
+            "shipname": self._shipname[slot],
+            "callsign": self._callsign[slot],
+            "ship_type": None if self._ship_type[slot] < 0 else self._ship_type[slot],
+            "imo": self._imo[slot] or None,
+            "dimensions": {
+                "to_bow": self._to_bow[slot],
+                "to_stern": self._to_stern[slot],
+                "to_port": self._to_port[slot],
+                "to_starboard": self._to_starboard[slot],
+            },
+            "last_seen": self._last_seen[slot],
+            "position_at": self._position_at[slot] or None,
+        }
+
+    def position(self, mmsi):
+        # (lat, lon) dell'ultima posizione valida, o None
+        slot = self._slots.get(mmsi)
+        if slot is None or self._cell[slot] is None:
+            return None
+        return self._lat[slot], self._lon[slot]
+
+    def _cells_in_bbox(self, lon_min, lat_min, lon_max, lat_max):
+        # Longitudini oltre ±180 (es. un raggio attorno a un punto vicino all'antimeridiano) si avvolgono
+        row_min = int((max(lat_min, -90.0) + 90.0) // self.cell_size)
+        row_max = int((min(lat_max, 90.0) + 90.0) // self.cell_size)
+        col_min = int((lon_min + 180.0) // self.cell_size)
+        col_max = int((lon_max + 180.0) // self.cell_size)
+        columns = self._columns
+        if col_max - col_min + 1 >= columns:
+            col_min, col_max = 0, columns - 1
+        width = col_max - col_min
+        grid = self._grid
+        if (row_max - row_min + 1) * (width + 1) > len(grid):
+            # Area molto grande: meno celle occupate che celle da visitare
+            return [slots for (row, col), slots in grid.items()
+                    if row_min <= row <= row_max and (col - col_min) % columns <= width]
+        cells = []
+        for row in range(row_min, row_max + 1):
+            for col in range(col_min, col_max + 1):
+                slots = grid.get((row, col % columns))
+                if slots:
+                    cells.append(slots)
+        return cells
+
+    def bbox(self, lon_min, lat_min, lon_max, lat_max):
+        """MMSI delle navi nel riquadro ``[lon_min, lat_min, lon_max, lat_max]`` (ordine GeoJSON)."""
+        lat = self._lat
+        lon = self._lon
+        mmsi = self._mmsi
+        result = []
+        for slots in self._cells_in_bbox(lon_min, lat_min, lon_max, lat_max):
+            for slot in slots:
+                if lat_min <= lat[slot] <= lat_max and lon_min <= lon[slot] <= lon_max:
+                    result.append(mmsi[slot])
+        return result
+
+    def radius(self, lat, lon, radius_m):
+        """Navi entro ``radius_m`` metri dal punto, come lista ordinata di (distanza_m, mmsi)."""
+        delta_lat = radius_m / METERS_PER_DEGREE
+        cos_lat = math.cos(math.radians(min(89.9, abs(lat) + delta_lat)))
+        delta_lon = min(180.0, delta_lat / max(cos_lat, 1e-6))
+        lats = self._lat
+        lons = self._lon
+        mmsi = self._mmsi
+        result = []
+        for slots in self._cells_in_bbox(lon - delta_lon, lat - delta_lat, lon + delta_lon, lat + delta_lat):
+            for slot in slots:
+                distance = haversine_m(lat, lon, lats[slot], lons[slot])
+                if distance <= radius_m:
+                    result.append((distance, mmsi[slot]))
+        result.sort()
+        return result
+
+    def nearest(self, lat, lon, count=10, max_radius_m=None):
+        """Le ``count`` navi più vicine al punto, come lista ordinata di (distanza_m, mmsi).
+
+        Visita la griglia ad anelli concentrici attorno alla cella del punto e
+        si ferma quando nessuna cella non ancora visitata può contenere una
+        nave più vicina dell'ultima trovata. Oltre ``NEAREST_MAX_RING`` anelli
+        (punto lontano dalle navi o zona poco densa) passa a una ricerca
+        best-first sui livelli superiori dell'indice.
+        """
+        if count <= 0 or not self._grid:
+            return []
+        row0, col0 = self._cell_of(lat, lon)
+        lats = self._lat
+        lons = self._lon
+        mmsi = self._mmsi
+        grid = self._grid
+        cell_size = self.cell_size
+        columns = self._columns
+        cos_lat = math.cos(math.radians(lat))
+        candidates = []
+        seen_cells = 0
+        ring = 0
+        # Anelli finché le celle visitate restano sotto un quarto di quelle occupate
+        while ring <= NEAREST_MAX_RING and 4 * (2 * ring + 1) ** 2 <= len(grid):
+            for row in range(row0 - ring, row0 + ring + 1):
+                step = 1 if row in (row0 - ring, row0 + ring) else 2 * ring
+                for col in range(col0 - ring, col0 + ring + 1, max(step, 1)):
+                    slots = grid.get((row, col % columns))
+                    if not slots:
+                        continue
+                    seen_cells += 1
+                    for slot in slots:
+                        candidates.append((haversine_m(lat, lon, lats[slot], lons[slot]), mmsi[slot]))
+            # Distanza minima garantita da qualunque cella fuori dall'anello corrente: dista almeno
+            # `ring` celle in latitudine o in longitudine, e il punto più vicino a una differenza di
+            # longitudine d si trova sul meridiano a asin(cos(lat) * sin(d)) (d oltre 90° non avvicina)
+            bound = EARTH_RADIUS_M * math.asin(cos_lat * math.sin(math.radians(min(90.0, ring * cell_size))))
+            if max_radius_m is not None and bound > max_radius_m:
+                break
+            if len(candidates) >= count:
+                candidates.sort()
+                del candidates[count:]
+                if candidates[-1][0] <= bound:
+                    break
+            if seen_cells == len(grid):
+                break
+            ring += 1
+        else:
+            return self._nearest_indexed(lat, lon, count, max_radius_m)
+        candidates.sort()
+        if max_radius_m is not None:
+            candidates = [item for item in candidates if item[0] <= max_radius_m]
+        return candidates[:count]
+
+    def _row_bound(self, level, row):
+        bounds = self._row_bounds.get((level, row))
+        if bounds is None:
+            size = self.cell_size * GRID_BRANCH ** level
+            lat_lo = row * size - 90.0
+            lat_hi = min(lat_lo + size, 90.0)
+            lo = math.radians(lat_lo)
+            hi = math.radians(lat_hi)
+            bounds = self._row_bounds[(level, row)] = (lat_lo, lat_hi, lo, hi, math.sin(lo), math.cos(lo),
+                                                      math.sin(hi), math.cos(hi))
+        return bounds
+
+    def _nearest_indexed(self, lat, lon, count, max_radius_m):
+        # Visita best-first dell'indice in ordine di distanza minima: si scende solo nei nodi che possono
+        # ancora contenere una delle `count` navi più vicine. I nodi di una stessa riga entrano come un
+        # cursore ordinato per distanza in longitudine dal punto: a parità di latitudine il limite cresce
+        # con la longitudine, quindi basta il limite del prossimo nodo della riga e gli altri non si
+        # calcolano finché non tocca a loro. Voci dello heap: (distanza minima, livello, tipo, riga,
+        # colonne ordinate, indice); ESTIMATE ha ancora il limite della sola latitudine, CURSOR quello
+        # esatto del nodo colonne[indice]
+        CURSOR, ESTIMATE = 0, 1
+        levels = self._levels
+        grid = self._grid
+        lats = self._lat
+        lons = self._lon
+        mmsi = self._mmsi
+        sizes = [self.cell_size * GRID_BRANCH ** level for level in range(len(levels) + 1)]
+        row_bounds = self._row_bounds
+        row_bound = self._row_bound
+        phi = math.radians(lat)
+        sin_phi = math.sin(phi)
+        cos_phi = math.cos(phi)
+        heappush = heapq.heappush
+
+        def lower_bound(level, row, col):
+            # Distanza minima dal punto alla cella (row, col) del livello
+            lat_lo, lat_hi, lo, hi, sin_lo, cos_lo, sin_hi, cos_hi = (row_bounds.get((level, row))
+                                                                      or row_bound(level, row))
+            size = sizes[level]
+            lon_lo = col * size - 180.0
+            if (lon - lon_lo) % 360.0 <= size:
+                # Longitudine del punto dentro la cella: il punto più vicino è sullo stesso meridiano
+                if lat < lat_lo:
+                    return (lat_lo - lat) * METERS_PER_DEGREE
+                if lat > lat_hi:
+                    return (lat - lat_hi) * METERS_PER_DEGREE
+                return 0.0
+            # Fuori: a parità di latitudine la distanza cresce con la differenza di longitudine, basta il
+            # bordo più vicino. Lungo quel meridiano cos(d) = sin φ sin ψ + cos φ cos Δλ cos ψ è massimo in
+            # ψ = atan2(sin φ, cos φ cos Δλ): se è nel tratto vale lì, altrimenti in uno dei due estremi
+            gap = min((lon_lo - lon) % 360.0, (lon - lon_lo - size) % 360.0)
+            b = cos_phi * math.cos(math.radians(gap))
+            if lo < math.atan2(sin_phi, b) < hi:
+                cos_d = math.hypot(sin_phi, b)
+            else:
+                cos_d = max(sin_phi * sin_lo + b * cos_lo, sin_phi * sin_hi + b * cos_hi)
+            # Un metro in meno: acos vicino a 1 arrotonda, il limite non deve superare la distanza vera
+            return EARTH_RADIUS_M * math.acos(min(1.0, cos_d)) - 1.0
+
+        def push_rows(level, rows, lower):
+            # Un cursore per riga, con il limite della sola differenza di latitudine (o quello del padre)
+            size = sizes[level]
+            for row, columns in rows.items():
+                lat_lo = row * size - 90.0
+                if lat < lat_lo:
+                    bound = max(lower, (lat_lo - lat) * METERS_PER_DEGREE)
+                elif lat > lat_lo + size:
+                    bound = max(lower, (lat - lat_lo - size) * METERS_PER_DEGREE)
+                else:
+                    bound = lower
+                if len(columns) > 1:
+                    columns = sorted(columns, key=lambda col: abs(((col + 0.5) * size - 180.0 - lon + 180.0)
+                                                                  % 360.0 - 180.0))
+                else:
+                    columns = list(columns)
+                heappush(heap, (bound, level, ESTIMATE, row, columns, 0))
+
+        top = len(levels)
+        rows = {}
+        for row, col in (levels[-1] if levels else grid):
+            rows.setdefault(row, set()).add(col)
+        heap = []
+        push_rows(top, rows, 0.0)
+        # Le `count` più vicine trovate finora, come max-heap (distanze negative)
+        best = []
+        while heap:
+            lower, level, kind, row, columns, index = heapq.heappop(heap)
+            if max_radius_m is not None and lower > max_radius_m:
+                break
+            if len(best) == count and -best[0][0] <= lower:
+                break
+            if kind == ESTIMATE:
+                # Solo ora il limite esatto del primo nodo della riga
+                bound = max(lower, lower_bound(level, row, columns[0]))
+                heappush(heap, (bound, level, CURSOR, row, columns, 0))
+                continue
+            key = (row, columns[index])
+            index += 1
+            if index < len(columns):
+                heappush(heap, (max(lower, lower_bound(level, row, columns[index])), level, CURSOR, row, columns,
+                                index))
+            if level:
+                push_rows(level - 1, levels[level - 1][key], lower)
+            else:
+                for slot in grid[key]:
+                    item = (-haversine_m(lat, lon, lats[slot], lons[slot]), -mmsi[slot])
+                    if len(best) < count:
+                        heappush(best, item)
+                    elif item > best[0]:
+                        heapq.heapreplace(best, item)
+        result = sorted((-distance, -vessel) for distance, vessel in best)
+        if max_radius_m is not None:
+            result = [item for item in result if item[0] <= max_radius_m]
+        return result